@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import platform
+import argparse
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+
+# Headless: no display needed
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import numpy as np
+
+from input import input_data
+import collisions
+from particles_cloud import particles_cloud
+
+
+# Timed phases of a time step
+benchmark_phases = ("move", "wall_collisions", "contact_detection", "contact_response", "transmission",
+					"change_person_state", "remove_deads", "compute_R_factor", "export")
+
+
+#---------------------------------
+# SYNTHETIC POPULATIONS
+#---------------------------------
+
+def build_population(nb_particles, density, saving_folder, collision_backend="cell_list", seed=0, compact_state=False):
+	""" Population of nb_particles persons in a square domain with given density (persons per km^2)
+
+	 1% of the population is infected 20 days before the start, so that most of them
+	 get symptoms at first step and contacts lead to transmissions. """
+
+	data = input_data("covid19")
+	data.population_size = nb_particles
+	data.L_X = data.L_Y = np.sqrt(nb_particles/density)
+	data.domain_size = (data.L_X, data.L_Y)
+	data.initial_infected_positions = [(0.5*data.L_X, 0.5*data.L_Y)]
+	data.saving_folder = saving_folder
+	data.collision_backend = collision_backend
+	data.profiling = False
+	data.seed = seed
+	data.compact_state = compact_state
+
+	population = particles_cloud(data)
+
+	nb_infected = max(1, nb_particles//100)
+	infected = population.rng.choice(np.nonzero(population.state==0)[0], nb_infected, replace=False)
+	population.infect(infected, -20.0, data)
+
+	return population, data
+
+
+
+def run_case(args):
+	""" Time each phase of nb_steps time steps on a synthetic population (after one warm-up step)
+
+	 Run in a fresh process so that peak memory is the one of this case only. """
+
+	nb_particles, density, nb_steps, collision_backend, seed, compact_state = args
+
+	baseline_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+	with tempfile.TemporaryDirectory() as saving_folder:
+
+		t0 = time.perf_counter()
+		population, data = build_population(nb_particles, density, saving_folder, collision_backend, seed,
+												compact_state)
+		setup_time = time.perf_counter() - t0
+
+		state_memory = population.get_memory_size()
+
+		phase_times = {phase: 0.0 for phase in benchmark_phases}
+		nb_contacts = 0
+		agent_steps = 0
+		sim_time = 0.0
+
+		for step in range(nb_steps+1):
+
+			# First step is not timed
+			timed = step>0
+			if timed:
+				agent_steps += population.Nb_particles
+
+			laps = [time.perf_counter()]
+
+			population.move(data.dt)
+			laps.append(time.perf_counter())
+
+			population.resolve_wall_collisions()
+			laps.append(time.perf_counter())
+
+			contact_i, contact_j, contact_unit, contact_norm = collisions.find_contacts(
+				population.get_position_matrix(), population.radius, population.domain_size, collision_backend)
+			laps.append(time.perf_counter())
+
+			collisions.resolve_contacts(population.position, population.velocity, population.radius,
+										contact_i, contact_j, contact_unit, contact_norm)
+			laps.append(time.perf_counter())
+
+			population.transmit_infection(contact_i, contact_j, sim_time, data)
+			laps.append(time.perf_counter())
+
+			population.change_person_state(sim_time, data)
+			laps.append(time.perf_counter())
+
+			population.remove_deads()
+			laps.append(time.perf_counter())
+
+			population.compute_R_factor(sim_time, data)
+			laps.append(time.perf_counter())
+
+			population.export_state_to_file(sim_time, step, saving_folder)
+			laps.append(time.perf_counter())
+
+			if timed:
+				for k, phase in enumerate(benchmark_phases):
+					phase_times[phase] += laps[k+1] - laps[k]
+				nb_contacts += len(contact_i)
+
+			sim_time += data.dt
+
+		population.close_outputs()
+
+	step_time = sum(phase_times.values())/nb_steps
+
+	# ru_maxrss is in kilobytes on Linux
+	peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+	return {"nb_particles": nb_particles,
+			"density": density,
+			"domain_size": data.L_X,
+			"collision_backend": collision_backend,
+			"compact_state": compact_state,
+			"nb_steps": nb_steps,
+			"setup_time": setup_time,
+			"step_time": step_time,
+			"phases": {phase: phase_times[phase]/nb_steps for phase in benchmark_phases},
+			"agent_steps_per_second": agent_steps/(step_time*nb_steps) if step_time>0.0 else 0.0,
+			"contact_pairs_per_step": nb_contacts/nb_steps,
+			"state_memory_mb": state_memory/1024.0**2,
+			"baseline_memory_mb": baseline_memory/1024.0,
+			"peak_memory_mb": peak_memory/1024.0}
+
+
+#---------------------------------
+# SUITE
+#---------------------------------
+
+def get_metadata():
+	""" Commit and machine the benchmark was run on """
+
+	try:
+		commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+								cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+	except OSError:
+		commit = None
+
+	return {"commit": commit,
+			"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+			"machine": platform.machine(),
+			"processor": platform.processor(),
+			"nb_cpus": os.cpu_count(),
+			"python": platform.python_version(),
+			"numpy": np.__version__}
+
+
+
+def run_benchmark(sizes, densities, nb_steps=None, collision_backend="cell_list", seed=0, compact_state=False,
+					verbose=True):
+	""" Run all (size, density) cases, each in its own process
+
+	 By default the number of steps decreases with size (about 2 million agent-steps per case,
+	 between 3 and 50 steps). Cases failing (e.g. out of memory) are reported with their error. """
+
+	context = multiprocessing.get_context("spawn")
+	results = {"metadata": get_metadata(), "cases": []}
+
+	for nb_particles in sizes:
+		for density in densities:
+
+			steps = nb_steps or int(np.clip(2000000//nb_particles, 3, 50))
+
+			try:
+				with context.Pool(1) as pool:
+					case = pool.apply(run_case, ((nb_particles, density, steps, collision_backend, seed, compact_state),))
+			except Exception as error:
+				case = {"nb_particles": nb_particles, "density": density, "error": repr(error)}
+
+			results["cases"].append(case)
+
+			if verbose:
+				print_case(case)
+
+	return results
+
+
+
+def print_case(case):
+
+	if "error" in case:
+		print(f">> N={case['nb_particles']:>8d}  density={case['density']:>8g}  failed: {case['error']}")
+		return
+
+	print(f">> N={case['nb_particles']:>8d}  density={case['density']:>8g}  "
+			f"step={1000.0*case['step_time']:9.2f} ms  "
+			f"throughput={case['agent_steps_per_second']:12.0f} agent-steps/s  "
+			f"state={case['state_memory_mb']:7.1f} MB  peak memory={case['peak_memory_mb']:8.1f} MB")
+	for phase in benchmark_phases:
+		print(f"      {phase:<20s} {1000.0*case['phases'][phase]:9.3f} ms")
+
+
+
+def compare_results(reference, results):
+	""" Print ratio of step times (reference/new: above 1 is a speed-up) for cases found in both """
+
+	reference_cases = {(c["nb_particles"], c["density"]): c for c in reference["cases"] if "error" not in c}
+
+	print(f">> Speed-up of {results['metadata']['commit']} over {reference['metadata']['commit']}")
+	for case in results["cases"]:
+		key = (case["nb_particles"], case["density"])
+		if "error" in case or key not in reference_cases:
+			continue
+		ref = reference_cases[key]
+		speedups = {phase: ref["phases"][phase]/case["phases"][phase]
+					for phase in benchmark_phases if case["phases"][phase]>0.0}
+		print(f">> N={key[0]:>8d}  density={key[1]:>8g}  step: {ref['step_time']/case['step_time']:.2f}x")
+		for phase in speedups:
+			print(f"      {phase:<20s} {speedups[phase]:.2f}x")
+
+
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description="Timing of the simulation kernels on synthetic populations")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+	parser.add_argument("--densities", type=float, nargs="+", default=[1000.0, 10000.0],
+						help="persons per km^2 (default population: 1000)")
+	parser.add_argument("--steps", type=int, default=None, help="timed steps per case")
+	parser.add_argument("--backend", default="cell_list", choices=collisions.collision_backends)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--compact", action="store_true", help="compact state (float32, int8 state, int32 ids)")
+	parser.add_argument("--output", default="benchmark.json")
+	parser.add_argument("--compare", default=None, help="previous results (JSON) to compare with")
+	args = parser.parse_args()
+
+	results = run_benchmark(args.sizes, args.densities, args.steps, args.backend, args.seed, args.compact)
+
+	with open(args.output, "w") as f:
+		json.dump(results, f, indent=1)
+	print(f">> Results written in {args.output}")
+
+	if args.compare is not None:
+		with open(args.compare) as f:
+			compare_results(json.load(f), results)
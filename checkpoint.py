@@ -0,0 +1,79 @@
+import os
+import re
+
+import h5py
+
+
+# Counters of the time loop saved with the population
+loop_counters = ("time", "nb_timestep", "nb_saved_sol")
+
+
+def checkpoint_filename(folder, nb_timestep):
+	""" Checkpoints are named by time step, so that a run can restart from any of them """
+	return folder + "/checkpoint_{:06d}.h5".format(nb_timestep)
+
+
+
+def list_checkpoints(folder):
+	""" Time steps and file names of the checkpoints of folder, sorted by time step """
+
+	steps = []
+	for name in os.listdir(folder):
+		match = re.fullmatch(r"checkpoint_(\d+)\.h5", name)
+		if match is not None:
+			steps.append(int(match.group(1)))
+
+	return [(step, checkpoint_filename(folder, step)) for step in sorted(steps)]
+
+
+
+def remove_checkpoints(folder, keep_last=None, after=None):
+	""" Remove the checkpoints of folder but the last keep_last ones (None: all kept),
+	 and the ones written after time step after (None: none) """
+
+	checkpoints = list_checkpoints(folder)
+
+	if keep_last is not None:
+		for step, filename in checkpoints[:-keep_last]:
+			os.remove(filename)
+
+	if after is not None:
+		for step, filename in checkpoints:
+			if step > after and os.path.exists(filename):
+				os.remove(filename)
+
+
+
+def save_checkpoint(filename, population, counters):
+	""" Write the full state of the population (including its random generator) and the loop counters
+
+	 The file is written next to filename and then renamed, so that an interrupted
+	 write never replaces a valid checkpoint. """
+
+	state = population.get_state()
+
+	with h5py.File(filename + ".tmp", "w") as hf:
+
+		population_group = hf.create_group("POPULATION")
+		for name in state:
+			population_group.create_dataset(name, data=state[name])
+
+		for name in loop_counters:
+			hf.attrs[name] = counters[name]
+
+	os.replace(filename + ".tmp", filename)
+
+
+
+def load_checkpoint(filename):
+	""" Read a checkpoint
+
+	 Returns the state of the population (see particles_cloud.get_state) and the loop counters. """
+
+	with h5py.File(filename, "r") as hf:
+
+		state = {name: hf["POPULATION"][name][()] for name in hf["POPULATION"]}
+
+		counters = {name: hf.attrs[name].item() for name in loop_counters}
+
+	return state, counters
@@ -0,0 +1,187 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+#---------------------------------
+# CONTACT DETECTION
+#---------------------------------
+
+# Every function below returns the contacts as a tuple (i, j, unit, norm):
+# i < j are the indices of the particles in contact, sorted by (i, j),
+# unit[k] is the unit vector pointing from i[k] to j[k] and norm[k] their distance
+
+
+def contacts_from_pairs(position, i, j, radius):
+	""" Keep pairs closer than 2*radius, ordered by (i, j), with their unit vectors and distances"""
+
+	# Ordering each pair (i < j) and the pairs list
+	i, j = np.minimum(i, j), np.maximum(i, j)
+	order = np.lexsort((j, i))
+	i, j = i[order], j[order]
+
+	# vector pointing from i to j
+	diff = position[j] - position[i]
+	norm = np.sqrt(diff[:,0]**2 + diff[:,1]**2)
+
+	# Contacts
+	collided = norm < 2.0 * radius
+	i, j, diff, norm = i[collided], j[collided], diff[collided], norm[collided]
+
+	# unit vector from i to j
+	unit = diff / norm[:,None]
+
+	return i, j, unit, norm
+
+
+
+def find_contacts_dense(position, radius):
+	""" Reference method testing all pairs of particles (O(N^2) in time and memory)"""
+
+	nop = len(position)
+
+	# make 3D arrays with repeated position vectors to form combinations
+	# diff_i[i][j] = position[i]
+	# diff_j[i][j] = position[j]
+	# diff[i][j] = vector pointing from i to j
+	# norm[i][j] = sqrt( diff[i][j]**2 )
+	diff_i = np.repeat(position.reshape(1, nop, 2) , nop, axis=1).reshape(nop, nop, 2)
+	diff_j = np.repeat(position.reshape(1, nop, 2) , nop, axis=0)
+	diff = diff_j - diff_i
+	norm = np.linalg.norm(diff, axis=2)
+
+	# make norm upper triangular (excluding diagonal)
+	# This prevents double counting the i,j and j,i pairs
+	collided = np.triu(norm <2.0 * radius, k=1)
+
+	i, j = np.nonzero(collided)
+
+	return contacts_from_pairs(position, i, j, radius)
+
+
+
+def find_contacts_cell_list(position, radius, domain_size, origin=(0.0, 0.0)):
+	""" Uniform grid of cells of size >= 2*radius: only particles in neighboring cells are tested
+	 (the grid covers the box of size domain_size starting at origin)
+
+	 Only occupied cells are stored (memory and time are O(N), whatever the number of cells)"""
+
+	nop = len(position)
+
+	# Number of cells in each direction (cells are at least as large as the contact distance)
+	nb_cells_x = max(1, int(domain_size[0] / (2.0*radius)))
+	nb_cells_y = max(1, int(domain_size[1] / (2.0*radius)))
+	cell_size_x = domain_size[0] / nb_cells_x
+	cell_size_y = domain_size[1] / nb_cells_y
+
+	# Cell of each particle (particles slightly outside the domain go to border cells)
+	cell_x = np.clip(np.floor((position[:,0] - origin[0]) / cell_size_x).astype(np.int64), 0, nb_cells_x-1)
+	cell_y = np.clip(np.floor((position[:,1] - origin[1]) / cell_size_y).astype(np.int64), 0, nb_cells_y-1)
+	cell = cell_x * nb_cells_y + cell_y
+
+	# Particles sorted by cell: particles of occupied cell k are sorted_part[start[k]:start[k]+count[k]]
+	sorted_part = np.argsort(cell, kind="stable")
+	occupied, start, count = np.unique(cell[sorted_part], return_index=True, return_counts=True)
+
+	# Position of each particle in the sorted list
+	rank = np.empty(nop, dtype=int)
+	rank[sorted_part] = np.arange(nop)
+
+	list_i = []
+	list_j = []
+
+	# Half stencil of neighboring cells: each pair of cells is visited once
+	for shift_x, shift_y in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+
+		neighbor_x = cell_x + shift_x
+		neighbor_y = cell_y + shift_y
+		valid = (neighbor_x < nb_cells_x) & (neighbor_y >= 0) & (neighbor_y < nb_cells_y)
+		part = np.nonzero(valid)[0]
+		neighbor = neighbor_x[valid] * nb_cells_y + neighbor_y[valid]
+
+		# Occupied neighboring cells
+		k = np.minimum(np.searchsorted(occupied, neighbor), len(occupied)-1)
+		found = occupied[k]==neighbor
+
+		# Candidates of each particle: all the particles of the neighboring cell
+		nb_candidates = np.where(found, count[k], 0)
+		total = np.sum(nb_candidates)
+		if total==0:
+			continue
+		first = np.cumsum(nb_candidates) - nb_candidates
+		i = np.repeat(part, nb_candidates)
+		j_rank = np.repeat(start[k] - first, nb_candidates) + np.arange(total)
+
+		# In the same cell, pairs are kept once
+		if shift_x==0 and shift_y==0:
+			keep = j_rank > rank[i]
+			i, j_rank = i[keep], j_rank[keep]
+
+		list_i.append(i)
+		list_j.append(sorted_part[j_rank])
+
+	if len(list_i)==0:
+		return contacts_from_pairs(position, np.zeros(0, dtype=int), np.zeros(0, dtype=int), radius)
+
+	return contacts_from_pairs(position, np.concatenate(list_i), np.concatenate(list_j), radius)
+
+
+
+def find_contacts_kdtree(position, radius):
+	""" KD-tree of positions queried for all pairs closer than 2*radius"""
+
+	pairs = cKDTree(position).query_pairs(2.0 * radius, output_type="ndarray")
+
+	return contacts_from_pairs(position, pairs[:,0], pairs[:,1], radius)
+
+
+
+# Available contact detection methods
+collision_backends = ("dense", "cell_list", "kdtree")
+
+
+def find_contacts(position, radius, domain_size, backend, origin=(0.0, 0.0)):
+	""" Find contacts with the given backend (all backends give the same contacts)"""
+
+	if backend=="dense":
+		return find_contacts_dense(position, radius)
+	elif backend=="cell_list":
+		return find_contacts_cell_list(position, radius, domain_size, origin)
+	elif backend=="kdtree":
+		return find_contacts_kdtree(position, radius)
+	else:
+		raise ValueError(f"Unknown collision backend: {backend}")
+
+
+#---------------------------------
+# COLLISION RESPONSE
+#---------------------------------
+
+def resolve_contacts(position, velocity, radius, i, j, unit, norm):
+	""" Elastic response of all contacts at once (velocity reflections and push-outs)
+
+	Contacts are applied in their (i, j) order: a particle in several contacts
+	has its velocity reflected successively along each unit vector, exactly as
+	if contacts were processed one by one. Push-outs of particles j are summed. """
+
+	# The reflection of a particle only depends on its own velocity and on the unit vector,
+	# so both ends of each contact are handled independently
+	part = np.concatenate([i, j])
+	part_unit = np.concatenate([unit, unit])
+	contact_order = np.concatenate([np.arange(len(i)), np.arange(len(j))])
+
+	# Rank of each contact among the contacts of its particle
+	order = np.lexsort((contact_order, part))
+	part, part_unit = part[order], part_unit[order]
+	is_first = np.ones(len(part), dtype=bool)
+	is_first[1:] = part[1:]!=part[:-1]
+	first = np.nonzero(is_first)[0]
+	rank = np.arange(len(part)) - np.repeat(first, np.diff(np.append(first, len(part))))
+
+	# flip velocities along the axis given by `unit`: at each round a particle appears at most once
+	for r in range(np.max(rank, initial=-1)+1):
+		current = rank==r
+		p, u = part[current], part_unit[current]
+		velocity[p] -= 2.0 * np.sum(u * velocity[p], axis=1)[:,None] * u
+
+	# push particles j to be 1 unit from i
+	np.add.at(position, j, (2.0 * radius - norm)[:,None] * unit)
@@ -0,0 +1,261 @@
+import multiprocessing
+
+import numpy as np
+
+import collisions
+from particle import VACCINATED
+
+
+# Per-particle arrays owned by the workers
+worker_columns = ("id", "position", "velocity", "state", "vaccinated")
+
+
+#---------------------------------
+# PARTICLES EXCHANGED BETWEEN WORKERS
+#---------------------------------
+
+def select(particles, mask):
+	return {name: particles[name][mask] for name in worker_columns}
+
+
+def concatenate(list_particles):
+	""" Particles of several dictionaries, sorted by id """
+	particles = {name: np.concatenate([p[name] for p in list_particles]) for name in worker_columns}
+	return select(particles, np.argsort(particles["id"], kind="stable"))
+
+
+def exchange(left, right, to_left, to_right):
+	""" Send particles to the neighbor strips and receive theirs
+
+	 Data first goes to the right then to the left: the last worker of each
+	 direction only receives, so that blocking sends always end. """
+
+	received = []
+
+	if right is not None:
+		right.send(to_right)
+	if left is not None:
+		received.append(left.recv())
+
+	if left is not None:
+		left.send(to_left)
+	if right is not None:
+		received.append(right.recv())
+
+	return received
+
+
+#---------------------------------
+# WORKER
+#---------------------------------
+
+def domain_worker(k, nb_workers, connection, left, right, particles, radius, domain_size, dt, backend):
+	""" Process owning the particles of strip k (x in [k*width, (k+1)*width))
+
+	 Messages from master:
+	 - ("step", updates): apply changes of state and velocity, move, reflect on walls, migrate,
+	   exchange halos, resolve contacts; answers with infection trials and number of contacts
+	 - ("gather", None): answers with ids, positions and velocities of owned particles
+	 - ("stop", None) """
+
+	width = domain_size[0] / nb_workers
+
+	# Strip bounds (first and last strips also own particles slightly outside the domain)
+	x_min = k*width if k>0 else -np.inf
+	x_max = (k+1)*width if k<nb_workers-1 else np.inf
+
+	# Particles closer than halo to a border can be in contact with particles of the neighbor strip
+	halo = 2.0*radius*(1.0 + 1e-6)
+
+	# Box covered by the cells of owned and halo particles
+	origin = (k*width - halo, 0.0)
+	box_size = (width + 2.0*halo, domain_size[1])
+
+	while True:
+
+		message, content = connection.recv()
+
+		if message=="stop":
+			break
+
+		if message=="gather":
+			connection.send((particles["id"], particles["position"], particles["velocity"]))
+			continue
+
+		# Changes of state and velocity decided by master at previous step (dead particles are removed)
+		state_ids, states, velocity_ids, velocities = content
+		index = np.searchsorted(particles["id"], state_ids)
+		owned = (index < len(particles["id"])) & (particles["id"][np.minimum(index, len(particles["id"])-1)]==state_ids)
+		particles["state"][index[owned]] = states[owned]
+		index = np.searchsorted(particles["id"], velocity_ids)
+		owned = (index < len(particles["id"])) & (particles["id"][np.minimum(index, len(particles["id"])-1)]==velocity_ids)
+		particles["velocity"][index[owned]] = velocities[owned]
+		particles = select(particles, particles["state"]!=4)
+
+		# Move and reflect on walls (as particles_cloud.move and resolve_wall_collisions)
+		position = particles["position"]
+		velocity = particles["velocity"]
+		position += velocity * dt
+		for d in range(2):
+			pos = position[:, d]
+			vel = velocity[:, d]
+			reflected = (((pos <= radius) & (vel < 0)) | ((pos >= domain_size[d]-radius) & (vel > 0)))
+			vel[reflected] = -vel[reflected]
+
+		# Particles leaving the strip go to the neighbor strip
+		x = particles["position"][:, 0]
+		to_left = x < x_min
+		to_right = x >= x_max
+		received = exchange(left, right, select(particles, to_left), select(particles, to_right))
+		particles = concatenate([select(particles, ~(to_left | to_right))] + received)
+
+		# Halo particles of neighbor strips
+		x = particles["position"][:, 0]
+		ghosts = exchange(left, right, select(particles, x < x_min + halo), select(particles, x >= x_max - halo))
+
+		# Owned and halo particles sorted by id: contacts are in the same order as in the serial engine
+		local = concatenate([particles] + ghosts)
+		is_owned = np.isin(local["id"], particles["id"], assume_unique=True)
+
+		i, j, unit, norm = collisions.find_contacts(local["position"], radius, box_size, backend, origin)
+		collisions.resolve_contacts(local["position"], local["velocity"], radius, i, j, unit, norm)
+
+		particles["position"] = local["position"][is_owned]
+		particles["velocity"] = local["velocity"][is_owned]
+
+		# Infection trials of owned targets (as particles_cloud.transmit_infection)
+		trials = []
+		for direction, (source, target) in enumerate(((i, j), (j, i))):
+			trial = ((local["state"][source]==2) & (local["state"][target]==0) & ~local["vaccinated"][target]
+					& is_owned[target])
+			trials.append((local["id"][i[trial]], local["id"][j[trial]], np.full(np.sum(trial), direction)))
+
+		# A contact is counted by the worker owning its first particle
+		nb_contacts = int(np.sum(is_owned[i]))
+
+		connection.send(([np.concatenate(t) for t in zip(*trials)], nb_contacts))
+
+
+
+#---------------------------------
+# MASTER
+#---------------------------------
+
+class domain_decomposition(object):
+	""" Parallel engine: the domain is split in nb_domain_workers vertical strips owned by worker processes
+
+	 Workers own positions and velocities of the particles of their strip. At each step, they move
+	 them, reflect them on walls, send particles leaving the strip to the neighbor strip, exchange
+	 halo particles (within 2*radius of strip borders) and resolve contacts of their particles.
+	 Disease states stay in particles_cloud: infection trials found by the workers are drawn in the
+	 order of the serial engine, and changes of state and velocity are sent to workers with next
+	 step. The engine therefore gives the same results as the serial one for a given seed.
+
+	 Positions and velocities of particles_cloud are only updated by gather(). """
+
+	def __init__(self, population, input_data):
+
+		self.population = population
+		self.nb_workers = input_data.nb_domain_workers
+
+		width = input_data.domain_size[0] / self.nb_workers
+		strip = np.clip(np.floor(population.position[:, 0] / width).astype(int), 0, self.nb_workers-1)
+
+		particles = {"id": population.part_id, "position": population.position, "velocity": population.velocity,
+					"state": population.state, "vaccinated": population.has_flag(slice(None), VACCINATED)}
+
+		# Pipes between master and workers and between neighbor workers
+		self.connections = []
+		neighbors = [multiprocessing.Pipe() for k in range(self.nb_workers-1)]
+		self.processes = []
+		for k in range(self.nb_workers):
+			connection, worker_connection = multiprocessing.Pipe()
+			left = neighbors[k-1][1] if k>0 else None
+			right = neighbors[k][0] if k<self.nb_workers-1 else None
+			process = multiprocessing.Process(target=domain_worker,
+											args=(k, self.nb_workers, worker_connection, left, right,
+												select(particles, strip==k), population.radius,
+												input_data.domain_size, input_data.dt, input_data.collision_backend))
+			process.start()
+			self.connections.append(connection)
+			self.processes.append(process)
+
+		# State and velocity of each id known by the workers (velocity changes are sent at next step)
+		self.worker_state = np.full(population.population_size, 4, dtype=population.state.dtype)
+		self.worker_state[population.part_id] = population.state
+		self.worker_velocity = np.zeros((population.population_size, 2), dtype=population.velocity.dtype)
+		self.worker_velocity[population.part_id] = population.velocity
+
+		self.updates = self.get_updates()
+
+
+	def advance(self, time, input_data):
+		""" Move, walls, contacts (in workers) and infections of current step """
+
+		population = self.population
+
+		for connection in self.connections:
+			connection.send(("step", self.updates))
+		results = [connection.recv() for connection in self.connections]
+
+		# Infection trials in the order of the serial engine: by contact (id_i, id_j), then direction
+		id_i, id_j, direction = [np.concatenate(arrays) for arrays in zip(*[trials for trials, nb in results])]
+		order = np.lexsort((direction, id_j, id_i))
+		id_i, id_j, direction = id_i[order], id_j[order], direction[order]
+		source = np.where(direction==0, id_i, id_j)
+		target = np.where(direction==0, id_j, id_i)
+
+		population.nb_contacts = sum(nb for trials, nb in results)
+		population.apply_infection_trials(population.index_of_id[source], population.index_of_id[target],
+										time, input_data)
+
+
+	def get_updates(self):
+		""" Changes of state and velocity since last call (removed particles have state 4) """
+
+		population = self.population
+
+		state = np.full(population.population_size, 4, dtype=population.state.dtype)
+		state[population.part_id] = population.state
+		state_ids = np.nonzero(state!=self.worker_state)[0]
+		self.worker_state = state
+
+		changed = np.any(population.velocity!=self.worker_velocity[population.part_id], axis=1)
+		velocity_ids = population.part_id[changed]
+		velocities = population.velocity[changed]
+		self.worker_velocity[velocity_ids] = velocities
+
+		return state_ids, state[state_ids], velocity_ids, velocities
+
+
+	def synchronize(self):
+		""" Record changes of state and velocity of the step (after change of states and removal of deads) """
+		self.updates = self.get_updates()
+
+
+	def gather(self):
+		""" Copy positions and velocities of workers in particles_cloud (changes not sent yet are kept) """
+
+		population = self.population
+
+		for connection in self.connections:
+			connection.send(("gather", None))
+		for connection in self.connections:
+			ids, position, velocity = connection.recv()
+			index = population.index_of_id[ids]
+			alive = index>=0
+			population.position[index[alive]] = position[alive]
+			population.velocity[index[alive]] = velocity[alive]
+			self.worker_velocity[ids] = velocity
+
+		# Velocities changed at this step are the ones of particles_cloud
+		state_ids, states, velocity_ids, velocities = self.updates
+		population.velocity[population.index_of_id[velocity_ids]] = velocities
+		self.worker_velocity[velocity_ids] = velocities
+
+
+	def close(self):
+		for connection in self.connections:
+			connection.send(("stop", None))
+		for process in self.processes:
+			process.join()
@@ -0,0 +1,145 @@
+import os
+import copy
+import shutil
+import multiprocessing
+
+import numpy as np
+
+import h5py
+
+from input import input_data
+import simulation
+
+
+#---------------------------------
+# ENSEMBLE MEMBERS
+#---------------------------------
+
+def run_member(args):
+	""" Run one independently seeded simulation in its own folder
+
+	 seed is the SeedSequence of the run (child of the ensemble SeedSequence) """
+
+	member_input, run_id, seed = args
+
+	# Each member writes in its own sub-folder, with its own random stream
+	member_input = copy.copy(member_input)
+	member_input.saving_folder = member_input.saving_folder + "/run_{:04d}".format(run_id)
+	member_input.seed = seed
+
+	# Simulation without snapshots
+	population = simulation.initialize_population(member_input)
+	time_end, time_series = simulation.run_time_loop(population, member_input, verbose=False)
+
+	# The seed of the run is written with its time series (see time_series.load_seed)
+	return time_series
+
+
+#---------------------------------
+# STATISTICS
+#---------------------------------
+
+def aggregate_time_series(list_time_series, dt, percentiles=(5, 50, 95)):
+	""" Mean, percentiles and peak statistics of an ensemble of runs
+
+	 Runs stop when infection disappears: after its end, a run keeps
+	 its last compartment counts and a zero R factor. """
+
+	nb_runs = len(list_time_series)
+	nb_steps = max(len(ts["time"]) for ts in list_time_series)
+
+	# Aligned series (run, step, state) and (run, step)
+	counts = np.zeros((nb_runs, nb_steps, 5))
+	R_factor = np.zeros((nb_runs, nb_steps))
+	for k, ts in enumerate(list_time_series):
+		n = len(ts["time"])
+		counts[k, :n] = ts["counts"]
+		counts[k, n:] = ts["counts"][-1]
+		R_factor[k, :n] = ts["R_factor"]
+
+	time = dt * np.arange(nb_steps)
+
+	# Peak of infected persons with symptoms for each run
+	peak_index = np.argmax(counts[:, :, 2], axis=1)
+	peak_value = counts[np.arange(nb_runs), peak_index, 2]
+	peak_time = time[peak_index]
+
+	return {"time": time,
+			"percentiles": np.array(percentiles),
+			"counts_mean": np.mean(counts, axis=0),
+			"counts_percentiles": np.percentile(counts, percentiles, axis=0),
+			"R_factor_mean": np.mean(R_factor, axis=0),
+			"R_factor_percentiles": np.percentile(R_factor, percentiles, axis=0),
+			"peak_value": peak_value,
+			"peak_time": peak_time,
+			"peak_value_mean": np.mean(peak_value),
+			"peak_value_percentiles": np.percentile(peak_value, percentiles),
+			"peak_time_mean": np.mean(peak_time),
+			"peak_time_percentiles": np.percentile(peak_time, percentiles),
+			"deaths": counts[:, -1, 4],
+			"duration": np.array([ts["time"][-1] for ts in list_time_series])}
+
+
+
+def run_ensemble(input_data, nb_runs, nb_workers=None, seed=None):
+	""" Run nb_runs independently seeded simulations in a process pool and aggregate them
+
+	 Streams of the runs are spawned from seed (by default input_data.seed, an int or a SeedSequence):
+	 the ensemble is reproducible unless both are None.
+
+	 Results are written in input_data.saving_folder: one run_XXXX folder per run
+	 and ensemble_statistics.h5 for aggregated statistics. """
+
+	# Clean previous ensemble (members only clean their own folder)
+	if os.path.exists(input_data.saving_folder):
+		shutil.rmtree(input_data.saving_folder)
+	os.makedirs(input_data.saving_folder)
+
+	# Members do not save snapshots
+	member_input = copy.copy(input_data)
+	member_input.save_snapshots = False
+
+	# Independent random streams for each run
+	# (a given SeedSequence is copied: spawning from it again gives the same streams)
+	if seed is None:
+		seed = input_data.seed
+	if isinstance(seed, np.random.SeedSequence):
+		seed_sequence = np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key)
+	else:
+		seed_sequence = np.random.SeedSequence(seed)
+	tasks = [(member_input, run_id, child) for run_id, child in enumerate(seed_sequence.spawn(nb_runs))]
+
+	with multiprocessing.Pool(nb_workers) as pool:
+		list_time_series = pool.map(run_member, tasks)
+
+	statistics = aggregate_time_series(list_time_series, input_data.dt)
+
+	# Writing statistics
+	with h5py.File(input_data.saving_folder + "/ensemble_statistics.h5", "w") as hf:
+		hf.create_dataset("NB_RUNS", data=np.array((nb_runs)))
+		hf.create_dataset("SEED_ENTROPY", data=str(seed_sequence.entropy))
+		hf.create_dataset("SPAWN_KEY", data=np.array(seed_sequence.spawn_key, dtype=np.int64))
+		for name in statistics:
+			hf.create_dataset(name.upper(), data=statistics[name])
+
+	return statistics
+
+
+
+if __name__ == "__main__":
+
+	# Input data
+	disease_type = "covid19"
+	input_data = input_data(disease_type)
+	input_data.saving_folder = "./results_ensemble"
+
+	# Check input data
+	input_data.check_inputs()
+
+	statistics = run_ensemble(input_data, nb_runs=32)
+
+	print(f">> Peak of infected persons with symptoms: {statistics['peak_value_mean']:.1f} "
+			f"(percentiles {statistics['percentiles']}: {statistics['peak_value_percentiles']})")
+	print(f">> Time of peak: {statistics['peak_time_mean']:.1f} days "
+			f"(percentiles {statistics['percentiles']}: {statistics['peak_time_percentiles']})")
+	print(f">> Deaths: {np.mean(statistics['deaths']):.1f}")
@@ -0,0 +1,146 @@
+import os
+
+import numpy as np
+
+import h5py
+
+
+# Kinds of events and associated file names / datasets
+event_kinds = ("incubation", "onset_to_death", "onset_to_recovery")
+file_names = {"incubation": "incubation_times", "onset_to_death": "onset_to_death_times",
+				"onset_to_recovery": "onset_to_recovery_times"}
+dataset_names = {"incubation": "INCUBATION", "onset_to_death": "ONSET_TO_DEATH",
+				"onset_to_recovery": "ONSET_TO_RECOVERY"}
+
+# Output formats
+log_formats = ("hdf5", "binary", "text")
+
+
+class event_log(object):
+	""" In-memory buffer of disease times (incubation, onset to death, onset to recovery)
+
+	 Times are flushed in bulk when buffer_size events are waiting and at the end of the run.
+	 Formats:
+	 - hdf5: one disease_times.h5 file with one extendable dataset per kind of event
+	 - binary: raw float64 values appended to one .bin file per kind of event
+	 - text: one value per line in one .txt file per kind of event """
+
+	def __init__(self, saving_folder, log_format="hdf5", buffer_size=100000):
+
+		self.saving_folder = saving_folder
+		self.log_format = log_format
+		self.buffer_size = buffer_size
+
+		# Buffered times for each kind of event
+		self.buffer = {kind: [] for kind in event_kinds}
+		self.nb_buffered = 0
+
+
+	def record(self, kind, times):
+		""" Add an array of times to the buffer """
+
+		if len(times)==0:
+			return
+
+		self.buffer[kind].append(np.array(times, dtype=float))
+		self.nb_buffered += len(times)
+
+		if self.nb_buffered >= self.buffer_size:
+			self.flush()
+
+
+	def flush(self):
+		""" Write buffered times to disk """
+
+		if self.nb_buffered==0:
+			return
+
+		times = {kind: np.concatenate(self.buffer[kind]) for kind in event_kinds if len(self.buffer[kind])>0}
+
+		if self.log_format=="hdf5":
+			with h5py.File(self.saving_folder + "/disease_times.h5", "a") as hf:
+				for kind in times:
+					name = dataset_names[kind]
+					if name not in hf:
+						hf.create_dataset(name, shape=(0,), maxshape=(None,), chunks=(4096,), dtype=float)
+					dset = hf[name]
+					dset.resize((dset.shape[0] + len(times[kind]),))
+					dset[-len(times[kind]):] = times[kind]
+
+		elif self.log_format=="binary":
+			for kind in times:
+				with open(self.saving_folder + "/" + file_names[kind] + ".bin", "ab") as f:
+					times[kind].tofile(f)
+
+		elif self.log_format=="text":
+			for kind in times:
+				with open(self.saving_folder + "/" + file_names[kind] + ".txt", "a") as f:
+					f.write("".join(f"{t}\n" for t in times[kind]))
+
+		# Emptying buffer
+		self.buffer = {kind: [] for kind in event_kinds}
+		self.nb_buffered = 0
+
+
+
+	def get_sizes(self):
+		""" Size of what is written on disk for each kind of event (in event_kinds order):
+		 number of values for hdf5, number of bytes for binary and text """
+
+		sizes = np.zeros(len(event_kinds), dtype=np.int64)
+
+		for k, kind in enumerate(event_kinds):
+			if self.log_format=="hdf5":
+				if os.path.exists(self.saving_folder + "/disease_times.h5"):
+					with h5py.File(self.saving_folder + "/disease_times.h5", "r") as hf:
+						if dataset_names[kind] in hf:
+							sizes[k] = hf[dataset_names[kind]].shape[0]
+			else:
+				extension = ".bin" if self.log_format=="binary" else ".txt"
+				filename = self.saving_folder + "/" + file_names[kind] + extension
+				if os.path.exists(filename):
+					sizes[k] = os.path.getsize(filename)
+
+		return sizes
+
+
+	def truncate(self, sizes):
+		""" Discard what was written after given sizes (see get_sizes), used when resuming a run """
+
+		for k, kind in enumerate(event_kinds):
+			if self.log_format=="hdf5":
+				if os.path.exists(self.saving_folder + "/disease_times.h5"):
+					with h5py.File(self.saving_folder + "/disease_times.h5", "a") as hf:
+						if dataset_names[kind] in hf:
+							hf[dataset_names[kind]].resize((sizes[k],))
+			else:
+				extension = ".bin" if self.log_format=="binary" else ".txt"
+				filename = self.saving_folder + "/" + file_names[kind] + extension
+				if os.path.exists(filename):
+					os.truncate(filename, sizes[k])
+
+
+
+def load_disease_times(folder, log_format="hdf5"):
+	""" Read all the disease times written in folder (dictionary of arrays, one per kind of event) """
+
+	times = {kind: np.zeros(0) for kind in event_kinds}
+
+	if log_format=="hdf5":
+		if os.path.exists(folder + "/disease_times.h5"):
+			with h5py.File(folder + "/disease_times.h5", "r") as hf:
+				for kind in event_kinds:
+					if dataset_names[kind] in hf:
+						times[kind] = hf[dataset_names[kind]][()]
+
+	elif log_format=="binary":
+		for kind in event_kinds:
+			if os.path.exists(folder + "/" + file_names[kind] + ".bin"):
+				times[kind] = np.fromfile(folder + "/" + file_names[kind] + ".bin", dtype=float)
+
+	elif log_format=="text":
+		for kind in event_kinds:
+			if os.path.exists(folder + "/" + file_names[kind] + ".txt"):
+				times[kind] = np.atleast_1d(np.loadtxt(folder + "/" + file_names[kind] + ".txt"))
+
+	return times
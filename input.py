@@ -1,6 +1,10 @@
+import os
 import sys
 import utils
+import collisions
+import event_log
 
+import numpy as np
 import matplotlib.pyplot as plt
 
 
@@ -11,8 +15,23 @@ class input_data(object):
 
 		# General parameter for the simulation
 		self.population_size = 1000
+		self.shared_memory = False   # per-particle arrays in shared memory blocks (see shared_state.py)
+		self.compact_state = False   # float32 positions, velocities and times, int8 state, int32 ids (memory and output)
+		self.seed = None             # seed of the random generator of the run (int or numpy SeedSequence, None: not reproducible)
 		self.saving_folder = "./results"
 		self.saving_frequency = 0.2  # days
+		self.save_snapshots = True   # write particles state every saving_frequency
+		self.event_log_format = "hdf5"       # disease times output: "hdf5", "binary" or "text"
+		self.event_log_buffer_size = 100000  # number of disease times kept in memory before writing
+		self.nb_render_workers = None        # processes rendering images (None: all cores)
+		self.save_png_images = True          # write one PNG image per snapshot
+		self.video_mode = "stream"           # "stream": frames piped to ffmpeg, "png": video encoded from PNG images, "none"
+		self.pipelined_rendering = False     # render frames in a separate process during the simulation (time axis up to t_max)
+		self.render_queue_size = 8           # maximum number of snapshots waiting to be rendered
+		self.checkpoint_frequency = None     # days between checkpoints written in saving_folder as checkpoint_<step>.h5 (None: no checkpoint)
+		self.nb_checkpoints_kept = None      # number of last checkpoints kept (None: all)
+		self.restart_from = None             # checkpoint file to resume from (a different saving_folder starts a branch)
+		self.profiling = True                # time each phase of the loop, report written in profile.json
 
 		# Domain properties
 		self.L_X = 1.0     # km
@@ -28,10 +47,18 @@ class input_data(object):
 		self.mass = 1.0            # no unit (normalization)
 		self.initial_momentum = 0.05      #  km/day-1 (no mass unit)
 
+		# Contact detection method: "dense" (reference, O(N^2)), "cell_list" or "kdtree"
+		self.collision_backend = "cell_list"
+
+		# Parallel engine: number of vertical strips of the domain, each owned by a worker process (None: serial)
+		self.nb_domain_workers = None
+
 		# Disease characteristics
 		self.initial_infected_positions = [(0.5, 0.5), (0.505, 0.5), (0.495, 0.5)]   # As many as we want
 		self.infection_contact_prob = 0.7     # [0,1] (probability)
 		# Remark: infection probability can be disease dependant but also habit dependant (hand washing, etc...)
+		self.nb_cdf_quantiles = None    # None: exact inversion of tabulated cdf's, else size of interpolated quantiles tables
+		self.samplers = {}              # samplers of durations, built when first used (see get_sampler)
 		self.set_disease_data(disease_type)
 
 
@@ -146,6 +173,49 @@ class input_data(object):
 		if(self.preventive_confinement > 0.0 and self.vaccination_rate>0.0):
 			sys.exit("There is no need to confine if a vaccine is available")
 
+		if(self.nb_cdf_quantiles is not None and self.nb_cdf_quantiles<2):
+			sys.exit("Variable nb_cdf_quantiles should be None or at least 2")
+
+		if(self.event_log_format not in event_log.log_formats):
+			sys.exit(f"Variable event_log_format should be in {event_log.log_formats}")
+
+		if(self.nb_render_workers is not None and self.nb_render_workers<1):
+			sys.exit("Variable nb_render_workers should be None or at least 1")
+
+		if(self.video_mode not in ("stream", "png", "none")):
+			sys.exit("Variable video_mode should be in ('stream', 'png', 'none')")
+
+		if(self.video_mode=="png" and not self.save_png_images):
+			sys.exit("Video mode 'png' needs save_png_images")
+
+		if(self.pipelined_rendering and not self.save_snapshots):
+			sys.exit("Pipelined rendering needs save_snapshots")
+
+		if(self.seed is not None and not isinstance(self.seed, np.random.SeedSequence)
+			and not (isinstance(self.seed, int) and self.seed>=0)):
+			sys.exit("Variable seed should be None, a positive integer or a numpy SeedSequence")
+
+		if(self.checkpoint_frequency is not None and self.checkpoint_frequency<self.dt):
+			sys.exit("Variable checkpoint_frequency should be at least dt")
+
+		if(self.nb_checkpoints_kept is not None and (not isinstance(self.nb_checkpoints_kept, int) or self.nb_checkpoints_kept<1)):
+			sys.exit("Variable nb_checkpoints_kept should be None or a positive integer")
+
+		if(self.restart_from is not None and not os.path.isfile(self.restart_from)):
+			sys.exit(f"Checkpoint file {self.restart_from} not found")
+
+		if(self.restart_from is not None and self.pipelined_rendering):
+			sys.exit("Pipelined rendering cannot be used when resuming from a checkpoint")
+
+		if(self.nb_domain_workers is not None and (not isinstance(self.nb_domain_workers, int) or self.nb_domain_workers<1)):
+			sys.exit("Variable nb_domain_workers should be None or a positive integer")
+
+		if(self.nb_domain_workers is not None and self.L_X/self.nb_domain_workers < 8.0*self.radius):
+			sys.exit("Strips of the domain should be wider than 8 radius: decrease nb_domain_workers")
+
+		if(self.collision_backend not in collisions.collision_backends):
+			sys.exit(f"Variable collision_backend should be in {collisions.collision_backends}")
+
 
 	def export_input(self):
 
@@ -156,8 +226,13 @@ class input_data(object):
 
 			fi.write("[POPULATION PARAMETERS]\n")
 			fi.write(f"Population size: {self.population_size}\n")
+			fi.write(f"Random seed: {self.seed}\n")
+			fi.write(f"Compact state: {self.compact_state}\n")
+			fi.write(f"Shared memory state: {self.shared_memory}\n")
 			fi.write(f"Domain: {self.domain_size} km \n")
-			fi.write(f"Infection radius: {1000.0*self.radius} m\n\n")
+			fi.write(f"Infection radius: {1000.0*self.radius} m\n")
+			fi.write(f"Collision detection: {self.collision_backend}\n")
+			fi.write(f"Domain workers: {self.nb_domain_workers}\n\n")
 
 			fi.write("[EPIDEMIC PARAMETERS]\n")
 			fi.write("Initial position of patients: \n")
@@ -172,7 +247,13 @@ class input_data(object):
 			fi.write("[PREVENTION PARAMETERS]\n")
 			fi.write(f"Preventive confinement: {self.preventive_confinement} % of people\n")
 			fi.write(f"Confinement of symptomatic persons: {self.symptomatics_confinement}\n")
-			fi.write(f"Proportion of the population vaccinated: {100.0*self.vaccination_rate} %\n")
+			fi.write(f"Proportion of the population vaccinated: {100.0*self.vaccination_rate} %\n\n")
+
+			fi.write("[OUTPUT PARAMETERS]\n")
+			fi.write(f"Saving frequency: {self.saving_frequency} days\n")
+			fi.write(f"Disease times format: {self.event_log_format}\n")
+			if self.restart_from is not None:
+				fi.write(f"Resumed from checkpoint: {self.restart_from}\n")
 
 
 	#---------------------------------
@@ -222,6 +303,34 @@ class input_data(object):
 
 
 
+	def get_sampler(self, stage):
+		""" Sampler of durations of given stage, for current cdf table and nb_cdf_quantiles
+		 (built again only when one of them has changed) """
+
+		cdf_mat = getattr(self, stage + "_proba")
+		cached = self.samplers.get(stage)
+		if cached is None or cached[0] is not cdf_mat or cached[1]!=self.nb_cdf_quantiles:
+			cached = (cdf_mat, self.nb_cdf_quantiles, utils.inverse_cdf_sampler(cdf_mat, self.nb_cdf_quantiles))
+			self.samplers[stage] = cached
+
+		return cached[2]
+
+
+	@property
+	def incubation_sampler(self):
+		return self.get_sampler("incubation")
+
+
+	@property
+	def onset_to_death_sampler(self):
+		return self.get_sampler("onset_to_death")
+
+
+	@property
+	def onset_to_recov_sampler(self):
+		return self.get_sampler("onset_to_recov")
+
+
 
 	def plot_cdf(self):
 
@@ -1,114 +1,81 @@
 import os
 
-from input import input_data
+import input
 import utils
 import plot_utils
-from particles_cloud import particles_cloud
+import simulation
 
 
-#---------------------------------
-# INITIALIZATION
-#---------------------------------
+def main(disease_type="covid19"):
+	""" Simulation of the disease in a population, then images, curves and video """
 
-# Input data (and export)
-disease_type = "covid19"
-input_data = input_data(disease_type)
+	#---------------------------------
+	# INITIALIZATION
+	#---------------------------------
 
-# Check input data
-input_data.check_inputs()
+	# Input data (and export)
+	input_data = input.input_data(disease_type)
 
-# Clean previous computation and initialize solution folder
-utils.clean_init_directory(input_data)
+	# Check input data
+	input_data.check_inputs()
 
-# Export input parameters to keep track of it in results
-input_data.export_input()
+	# Clean previous computation, export inputs and initialize population
+	# (or resume from a checkpoint, see restart_from)
+	counters = None
+	if input_data.restart_from is None:
+		population = simulation.initialize_population(input_data)
+	else:
+		population, counters = simulation.resume_population(input_data)
 
-# Plot cdf of incubation time for sanity check
-input_data.plot_cdf()
+	# Plot cdf of incubation time for sanity check
+	input_data.plot_cdf()
 
-# Initialize population
-population = particles_cloud(input_data)
+	#---------------------------------
+	# TIME-STEPPING
+	#---------------------------------
 
-# Preventive confinement of part of the population
-population.set_preventive_confinement(input_data)
+	print("MAIN COMPUTATION \n")
 
-# Preventive vaccination campaign
-population.perform_vaccination_campaign(input_data)
+	# Frames may be rendered in a separate process while the simulation goes on
+	renderer = None
+	on_snapshot = None
+	if input_data.pipelined_rendering:
+		renderer = plot_utils.pipelined_renderer(input_data)
+		on_snapshot = renderer.submit
 
-#---------------------------------
-# TIME-STEPPING
-#---------------------------------
+	# Main loop: we stop when there is no one infected anymore
+	# (the rendering process always gets the end of snapshots, even if the loop fails)
+	try:
+		time_end, time_series = simulation.run_time_loop(population, input_data, on_snapshot=on_snapshot, counters=counters)
+	finally:
+		if renderer is not None:
+			renderer.finish()
 
-print("MAIN COMPUTATION \n")
+	print("\n")
 
-# Initial time
-time = 0.0
-nb_timestep = 0
+	print(f">> Infection has disappeared after {time_end} day \n")
 
-# Infected population or not (initially yes)
-population_is_infected = True
+	#---------------------------------
+	# POST-TREATMENT
+	#---------------------------------
 
-# Numerotation of saved solution
-nb_saved_sol = 0
+	print("POST-TREATMENT OF COMPUTATION \n")
 
-# Main loop: we stop when there is no one infected anymore
-while(population_is_infected and time < input_data.t_max):
+	# Sanity check of disease times statistics
+	utils.check_disease_times(input_data.saving_folder, input_data.event_log_format)
 
-	print(f">> Updating simulation at time t={time} days")
-	print(f"      >>  Size of population: {population.Nb_particles}")
-	print(f"      >>  Effective reproduction rate: {population.R_factor:.2f}")
-	print(f"      >>  Deaths: {input_data.population_size-population.Nb_particles}\n")
+	# Creating images (already done if rendered during simulation)
+	if renderer is None and input_data.save_snapshots:
+		plot_utils.create_png_images(time_end, input_data)
 
-	# Move particles
-	population.move(input_data.dt)
+	# Summary curves (R factor and number of persons in each state) from per-step time series
+	plot_utils.plot_time_series(input_data)
 
-	# Resolve wall collisions
-	population.resolve_wall_collisions()
-
-	# Resolve inter-particles collisions (including spreading the disease)
-	population.resolve_particle_collisions(time, input_data)
-
-	# Resolve change of state
-	population.change_person_state(time, input_data)
-
-	# Remove deads
-	population.remove_deads()
-
-	# Compute R factor for current population
-	population.compute_R_factor(time, input_data)
-
-	# Save state in h5 file
-	if abs(time-nb_saved_sol*input_data.saving_frequency)<0.9*input_data.dt:
-		population.export_state_to_file(time, nb_saved_sol, input_data.saving_folder)
-		nb_saved_sol += 1
-
-
-	# Check if there is still someone infected
-	population_is_infected = population.check_if_infected()
-
-	# time update
-	time += input_data.dt
-	nb_timestep += 1
-
-print("\n")
-
-time_end = time - input_data.dt  # We remove one dt else we have a small shift on plot
-print(f">> Infection has disappeared after {time_end} day \n")
-
-#---------------------------------
-# POST-TREATMENT
-#---------------------------------
-
-print("POST-TREATMENT OF COMPUTATION \n")
-
-# Sanity check of disease times statistics
-utils.check_disease_times(input_data.saving_folder)
-
-# Creating images
-plot_utils.create_png_images(time_end, input_data)
-
-# Generating video
-plot_utils.generate_video(input_data)
+	# Generating video
+	plot_utils.generate_video(input_data)
 
 
 
+# Processes rendering frames import this module: the run only starts in the main process
+if __name__ == "__main__":
+	main()
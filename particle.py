@@ -1,63 +1,102 @@
-
-import random
 import numpy as np
 
-import utils
 
+# Bits of the flags column of the particles_cloud store
+PREV_CONFINED = 1
+VACCINATED = 2
+WILL_DIE = 4
 
-class particle(object):
 
-	#---------------------------------
-	# INITIALIZATION
-	#---------------------------------
+def column_property(name, component=None):
+	""" Property reading/writing one entry of a column of the particles_cloud store"""
+
+	if component is None:
+		def getter(self):
+			return getattr(self.cloud, name)[self.index]
+		def setter(self, value):
+			getattr(self.cloud, name)[self.index] = value
+	else:
+		def getter(self):
+			return getattr(self.cloud, name)[self.index, component]
+		def setter(self, value):
+			getattr(self.cloud, name)[self.index, component] = value
+
+	return property(getter, setter)
+
 
-	def __init__(self, part_id, state, input_data):
 
-		# Particle id
-		self.part_id = part_id
+def flag_property(flag):
+	""" Property reading/writing one bit of the flags column of the particles_cloud store"""
 
-		# Radius
-		self.radius = input_data.radius
+	def getter(self):
+		return bool(self.cloud.flags[self.index] & flag)
+	def setter(self, value):
+		self.cloud.set_flag(np.array([self.index]), flag, value)
 
-		# Mass
-		self.mass = input_data.mass
+	return property(getter, setter)
 
-		# Initial position is random in [0,L_X]*[0,L_Y]
-		if state==0:
-			self.x = random.uniform(0, input_data.domain_size[0])
-			self.y = random.uniform(0, input_data.domain_size[1])
-		else:  # Warning: works because ill particle have lowest ID in list
-			self.x = input_data.infected_positions_by_id[part_id][0]
-			self.y = input_data.infected_positions_by_id[part_id][1]
 
-		# Initial speed: random angle with given momentum
-		self.set_initial_push(input_data)
+class particle(object):
+	""" Thin view on the particles_cloud arrays (kept for compatibility)
+
+	 The view follows its particle id, so it stays valid when dead particles are removed
+	 (accessing the data of a removed particle raises LookupError). """
+
+	#---------------------------------
+	# INITIALIZATION
+	#---------------------------------
 
+	def __init__(self, cloud, part_id):
 
-		# Time of infection: set to None if healthy at the beginning, zero else
-		if state==0:
-			self.infection_time = None
-		else:
-			self.infection_time = 0.0
-			self.incubation_period = 0.0 # First particle has already symptoms
+		# Cloud owning the data and id of the particle
+		self.cloud = cloud
+		self.id = part_id
 
-		# Person is initially in good health
-		# States:
-		# 0 : healthy
-		# 1 : infected without symptoms
-		# 2 : infected with symptoms
-		# 3 : recovered
-		# 4 : dead (internal state, particles are removed right after)
-		self.state = state
+		# Radius and mass are the same for all particles
+		self.radius = cloud.radius
+		self.mass = cloud.mass
 
-		# Preventive confinement on or not
-		self.is_prev_confined = False
 
-		# Number of infections provoked by the particle (initially 0)
-		self.nb_infections_provoked = 0
+	#---------------------------------
+	# DATA ACCESS
+	#---------------------------------
 
-		# Initially person is not vaccined againt disease
-		self.is_vaccinated = False
+	@property
+	def index(self):
+		# Current row of the particle in the cloud arrays (removed particles have no row)
+		index = self.cloud.index_of_id[self.id]
+		if index < 0:
+			raise LookupError(f"Particle {self.id} has been removed")
+		return index
+
+	# States:
+	# 0 : healthy
+	# 1 : infected without symptoms
+	# 2 : infected with symptoms
+	# 3 : recovered
+	# 4 : dead (internal state, particles are removed right after)
+	part_id = column_property("part_id")
+	state = column_property("state")
+
+	x = column_property("position", 0)
+	y = column_property("position", 1)
+	vx = column_property("velocity", 0)
+	vy = column_property("velocity", 1)
+
+	infection_time = column_property("infection_time")
+	incubation_period = column_property("incubation_period")
+	death_time = column_property("death_time")
+	recovery_time = column_property("recovery_time")
+
+	is_prev_confined = flag_property(PREV_CONFINED)
+	is_vaccinated = flag_property(VACCINATED)
+	will_die = flag_property(WILL_DIE)
+	nb_infections_provoked = column_property("nb_infections_provoked")
+
+	@property
+	def V(self):
+		# Row view: writing in it updates the cloud velocity
+		return self.cloud.velocity[self.index]
 
 
 	#---------------------------------
@@ -65,11 +104,7 @@ class particle(object):
 	#---------------------------------
 
 	def set_initial_push(self, input_data):
-		# Velocity imposed by chosing random angle and given norm
-		vel_norm = input_data.initial_momentum / input_data.mass
-		angle = random.uniform(0, 2.0*np.pi)
-		self.vx, self.vy = utils.vel_components_from_angle(angle, vel_norm)
-		self.V = np.array([self.vx, self.vy])
+		self.cloud.set_initial_push(np.array([self.index]), input_data)
 
 
 	#---------------------------------
@@ -78,21 +113,17 @@ class particle(object):
 
 	def move_particle(self, dt):
 		""" Update particle position using its velocity"""
-		self.x += self.vx * dt
-		self.y += self.vy * dt
+		self.cloud.position[self.index] += self.cloud.velocity[self.index] * dt
 
 
 	def reflect_wall(self, direction):
 		""" Update particle velocity due to wall reflection"""
 		if direction == "x":
 			self.vx = -self.vx
-			
+
 		elif direction == "y":
 			self.vy = -self.vy
 
-		# Update also velocity vector
-		self.V = np.array([self.vx, self.vy])
-
 
 	def get_infected(self):
 		self.state = 1
@@ -114,44 +145,18 @@ class particle(object):
 		self.infection_time = time
 
 
-	def set_incubation_period(self, time, results_folder):
-		# Setting incubation time
-		self.incubation_period = time
-		# We write incubation times in a file
-		with open(results_folder + "/incubation_times.txt", "a") as f:
-			f.write(f"{self.incubation_period}\n")
+	def set_incubation_period(self, time, results_folder=None):
+		# Times are written by the event log of the cloud
+		self.cloud.set_incubation_period(np.array([self.index]), np.array([time]))
 
 
-	def set_death_time(self, time, results_folder):
-		self.death_time = time
-		# We write death times in a file
-		with open(results_folder + "/onset_to_death_times.txt", "a") as f:
-			f.write(f"{self.death_time}\n")
+	def set_death_time(self, time, results_folder=None):
+		self.cloud.set_death_time(np.array([self.index]), np.array([time]))
 
 
-	def set_recovery_time(self, time, results_folder):
-		self.recovery_time = time
-		# We write recovery times in a file
-		with open(results_folder + "/onset_to_recovery_times.txt", "a") as f:
-			f.write(f"{self.recovery_time}\n")
+	def set_recovery_time(self, time, results_folder=None):
+		self.cloud.set_recovery_time(np.array([self.index]), np.array([time]))
 
 
 	def freeze(self):
-		self.vx = 0.0
-		self.vy = 0.0
-
-		# Update also velocity vector
-		self.V = np.array([self.vx, self.vy])
-
-
-	
-
-
-
-
-
-
-
-
-
-
+		self.cloud.velocity[self.index] = 0.0
@@ -1,344 +1,627 @@
-import random
+import json
 
 import numpy as np
-import scipy.spatial.distance as d
 
-import h5py
-
-from particle import particle
+from particle import particle, PREV_CONFINED, VACCINATED, WILL_DIE
+import collisions
+from event_log import event_log
+from trajectory import trajectory_writer
+from time_series import time_series_writer
+from shared_state import shared_memory_store
+import scheduler
+from scheduler import event_scheduler
 import utils
 
 
 class particles_cloud(object):
 
+	# Per-particle arrays: shape of one row, type and initial value
+	# (flags: preventive confinement, vaccination and outcome of the disease, as bits)
+	columns = {"part_id": ((), np.int64, 0),
+				"state": ((), np.int64, 0),
+				"position": ((2,), np.float64, 0.0),
+				"velocity": ((2,), np.float64, 0.0),
+				"infection_time": ((), np.float64, np.nan),
+				"incubation_period": ((), np.float64, np.nan),
+				"death_time": ((), np.float64, np.nan),
+				"recovery_time": ((), np.float64, np.nan),
+				"flags": ((), np.uint8, 0),
+				"nb_infections_provoked": ((), np.int64, 0)}
+
+	# Compact state (input_data.compact_state): 42 bytes per particle instead of 89
+	# (46 instead of 97 with index_of_id)
+	compact_columns = {"part_id": ((), np.int32, 0),
+						"state": ((), np.int8, 0),
+						"position": ((2,), np.float32, 0.0),
+						"velocity": ((2,), np.float32, 0.0),
+						"infection_time": ((), np.float32, np.nan),
+						"incubation_period": ((), np.float32, np.nan),
+						"death_time": ((), np.float32, np.nan),
+						"recovery_time": ((), np.float32, np.nan),
+						"flags": ((), np.uint8, 0),
+						"nb_infections_provoked": ((), np.int32, 0)}
+
 	#---------------------------------
 	# INITIALIZATION
 	#---------------------------------
 
-	def __init__(self, input_data):
+	def __init__(self, input_data, state=None):
 
-		# Radius of particles (sames for all)
+		# Radius and mass of particles (sames for all)
 		self.radius = input_data.radius
+		self.mass = input_data.mass
 
 		# Storing domain size
 		self.domain_size = input_data.domain_size
 
 		# Initial number of particles is population size
-		self.Nb_particles = input_data.population_size
+		self.population_size = input_data.population_size
+
+		# Types of per-particle arrays
+		if input_data.compact_state:
+			self.columns = self.compact_columns
+
+		# Per-particle arrays in process memory, or in shared memory blocks other processes can attach to
+		self.shared_memory = shared_memory_store() if input_data.shared_memory else None
+
+		# Random generator of the run, seeded from input_data.seed (int or SeedSequence, None: fresh entropy)
+		# The seed sequence is recorded in time_series.h5, so that any run can be reproduced (see load_seed)
+		self.seed_sequence = input_data.seed
+		if not isinstance(self.seed_sequence, np.random.SeedSequence):
+			self.seed_sequence = np.random.SeedSequence(input_data.seed)
+		self.rng = np.random.default_rng(self.seed_sequence)
+
+		# Initial state is random, or restored from a checkpoint
+		if state is None:
+			self.set_initial_state(input_data)
+		else:
+			self.set_state(state)
 
-		# Ensemble of particles is stored in a dictionary
-		self.particles_list = []
+		self.open_outputs(input_data, state)
+
+
+
+	def set_initial_state(self, input_data):
+		""" Random positions and velocities, given initially infected particles """
+
+		# Initial number of particles is population size
+		self.Nb_particles = input_data.population_size
+		nop = self.Nb_particles
 
 		# We make somes particles to be ill (no need to be random as every particle is placed randomly)
-		list_indices = [i for i in range(input_data.population_size)]
-		random.shuffle(list_indices)
-		indices_ill = list_indices[:len(input_data.initial_infected_positions)]
-
-		# Adding an attribute to input_data in order to pass it in particle
-		input_data.infected_positions_by_id = {}
-		for i in range(len(input_data.initial_infected_positions)):
-			input_data.infected_positions_by_id[indices_ill[i]] = input_data.initial_infected_positions[i]
-
-		# Initialize cloud of particles
-		for i in range(input_data.population_size):
-			part_id = i
-			if i in indices_ill:
-				state = 1
-			else:
-				state = 0
-			new_particle = particle(part_id, state, input_data)
-			self.particles_list.append(new_particle)
+		indices_ill = self.rng.permutation(nop)[:len(input_data.initial_infected_positions)]
+
+		# Particles are stored as columns (one array per quantity, one row per particle)
+		self.allocate_columns(nop)
+		self.part_id[:] = np.arange(nop)
+		self.index_of_id[:] = np.arange(nop)
+
+		# Person is initially in good health
+		# States:
+		# 0 : healthy
+		# 1 : infected without symptoms
+		# 2 : infected with symptoms
+		# 3 : recovered
+		# 4 : dead (internal state, particles are removed right after)
+		self.state[indices_ill] = 1
+
+		# Initial position is random in [0,L_X]*[0,L_Y], ill particles are placed at given positions
+		self.position[:] = self.rng.uniform((0.0, 0.0), self.domain_size, size=(nop, 2))
+		self.position[indices_ill] = np.array(input_data.initial_infected_positions)
+
+		# Initial speed: random angle with given momentum
+		self.set_initial_push(np.arange(nop), input_data)
+
+		# Disease times (NaN when not set)
+		# Time of infection: zero for initially ill particles
+		self.infection_time[indices_ill] = 0.0
+		self.incubation_period[indices_ill] = 0.0  # First particles have already symptoms
+
+		# Disease state transitions are scheduled as soon as their time is known
+		self.scheduler = event_scheduler()
+		self.scheduler.push(np.zeros(len(indices_ill)), scheduler.SYMPTOMS_ONSET, self.part_id[indices_ill])
+
+		# Flags (preventive confinement, vaccination and outcome of the disease) are initially not set
+		# and number of infections provoked by the particle is initially 0
+
+		# Number of persons in each state (dead persons are counted after being removed)
+		self.state_counts = np.bincount(self.state, minlength=5)
+
+		# Number of infections since last record of time series
+		self.nb_new_infections = 0
+
+		# Number of contact pairs and of state transitions during last step
+		self.nb_contacts = 0
+		self.nb_transitions = 0
 
 		# R_factor initially set to zero
 		self.R_factor = 0.0
 
+		# Running sums of R estimator for persons with symptoms, grouped by infection time:
+		# R_sums[infection_time] = [number of persons, number of infections they provoked]
+		self.R_sums = {}
+
+
+
+	def open_outputs(self, input_data, state=None):
+		""" Output files of the run (when resuming, what was written after the checkpoint is discarded) """
+
+		# Buffer of disease times written to disk
+		self.event_log = event_log(input_data.saving_folder, input_data.event_log_format,
+									input_data.event_log_buffer_size)
+
+		# Trajectory file with all snapshots (opened at first export)
+		self.trajectory = None
+
+		# Per-step compartment counts, new infections, deaths and R factor
+		if state is None:
+			self.time_series = time_series_writer(input_data.saving_folder + "/time_series.h5",
+													seed_sequence=self.seed_sequence)
+			return
+
+		self.event_log.truncate(state["event_log_sizes"])
+		self.time_series = time_series_writer(input_data.saving_folder + "/time_series.h5",
+												nb_rows=int(state["nb_time_series_rows"]))
+		if state["nb_snapshots"]>0:
+			self.trajectory = trajectory_writer(input_data.saving_folder + "/trajectory.h5",
+												nb_snapshots=int(state["nb_snapshots"]))
+
+
+	def allocate_columns(self, nop):
+		""" Per-particle arrays are allocated once for the whole population (removal compacts them in place)"""
+
+		self.buffers = {}
+		for name, (shape, dtype, value) in self.columns.items():
+			self.buffers[name] = self.allocate_array(name, (nop,) + shape, dtype)
+			self.buffers[name][:] = value
+
+		# Current index of each particle id (-1 once removed)
+		self.index_of_id = self.allocate_array("index_of_id", (self.population_size,), self.columns["part_id"][1])
+
+		self.set_columns_length(nop)
+
+
+	def allocate_array(self, name, shape, dtype):
+		""" Array in process memory, or in a shared memory block (input_data.shared_memory) """
+		if self.shared_memory is None:
+			return np.empty(shape, dtype=dtype)
+		return self.shared_memory.allocate(name, shape, dtype)
+
+
+	def set_columns_length(self, nop):
+		""" Columns are views on the first nop rows of the buffers """
+		for name in self.columns:
+			setattr(self, name, self.buffers[name][:nop])
+		if self.shared_memory is not None:
+			self.shared_memory.set_nb_particles(nop)
+
+
+	def get_state(self):
+		""" Dictionary of arrays with the full state of the population: columns, index of ids,
+		 scheduled transitions, counters, R sums, random generator state and size of outputs
+		 written so far (outputs are flushed) """
+
+		self.event_log.flush()
+		self.time_series.flush()
+
+		state = {name: getattr(self, name).copy() for name in self.columns}
+		state["index_of_id"] = self.index_of_id.copy()
+
+		# Heap of scheduled transitions, kept in heap order
+		heap = self.scheduler.heap
+		state["scheduled_times"] = np.array([event[0] for event in heap], dtype=float)
+		state["scheduled_kinds"] = np.array([event[1] for event in heap], dtype=int)
+		state["scheduled_ids"] = np.array([event[2] for event in heap], dtype=int)
+
+		state["state_counts"] = self.state_counts.copy()
+		state["nb_new_infections"] = self.nb_new_infections
+		state["R_factor"] = self.R_factor
+
+		# R sums, kept in insertion order
+		state["R_sums_times"] = np.array(list(self.R_sums.keys()), dtype=float)
+		state["R_sums_values"] = np.array(list(self.R_sums.values()), dtype=int).reshape(-1, 2)
+
+		state["rng_state"] = json.dumps(self.rng.bit_generator.state)
+
+		state["event_log_sizes"] = self.event_log.get_sizes()
+		state["nb_time_series_rows"] = self.time_series.nb_rows
+		state["nb_snapshots"] = 0 if self.trajectory is None else self.trajectory.nb_snapshots
+
+		return state
+
+
+
+	def set_state(self, state):
+		""" Restore a state given by get_state """
+
+		self.Nb_particles = len(state["part_id"])
+		self.allocate_columns(self.Nb_particles)
+		for name in self.columns:
+			getattr(self, name)[:] = state[name]
+		self.index_of_id[:] = state["index_of_id"]
+
+		self.scheduler = event_scheduler()
+		self.scheduler.heap = list(zip(state["scheduled_times"].tolist(), state["scheduled_kinds"].tolist(),
+										state["scheduled_ids"].tolist()))
+
+		self.state_counts = np.array(state["state_counts"])
+		self.nb_new_infections = int(state["nb_new_infections"])
+		self.nb_contacts = 0
+		self.nb_transitions = 0
+		self.R_factor = float(state["R_factor"])
+
+		self.R_sums = {time: values for time, values in zip(state["R_sums_times"].tolist(), state["R_sums_values"].tolist())}
+
+		self.rng.bit_generator.state = json.loads(state["rng_state"])
+
+
+
+	def get_shared_descriptor(self):
+		""" Descriptor of shared memory blocks, to attach read-only views with shared_state.attach_state """
+		return self.shared_memory.get_descriptor()
+
+
+	def release_shared_memory(self):
+		""" Arrays are moved back to process memory and shared blocks are removed (no process can attach after this) """
+
+		if self.shared_memory is None:
+			return
+
+		self.buffers = {name: buffer.copy() for name, buffer in self.buffers.items()}
+		self.index_of_id = self.index_of_id.copy()
+		store, self.shared_memory = self.shared_memory, None
+		self.set_columns_length(self.Nb_particles)
+		store.release()
+
+
+	def get_memory_size(self):
+		""" Number of bytes of per-particle arrays (allocated buffers and index of ids) """
+		return sum(buffer.nbytes for buffer in self.buffers.values()) + self.index_of_id.nbytes
+
+
+	#---------------------------------
+	# FLAGS
+	#---------------------------------
+
+	def has_flag(self, indices, flag):
+		""" Boolean array: given bit of flags is set for given particles """
+		return (self.flags[indices] & flag) != 0
+
+
+	def set_flag(self, indices, flag, value=True):
+		""" Set (value True) or clear (value False) given bit of flags for given particles """
+		value = np.broadcast_to(value, np.shape(self.flags[indices]))
+		self.flags[indices] = np.where(value, self.flags[indices] | flag, self.flags[indices] & ~np.uint8(flag))
+
+
+	@property
+	def is_prev_confined(self):
+		return self.has_flag(slice(None), PREV_CONFINED)
+
+	@property
+	def is_vaccinated(self):
+		return self.has_flag(slice(None), VACCINATED)
+
+	@property
+	def will_die(self):
+		return self.has_flag(slice(None), WILL_DIE)
+
+
+	@property
+	def particles_list(self):
+		""" List of particle views (compatibility with the object-per-particle API)"""
+		return [particle(self, part_id) for part_id in self.part_id]
+
 
 	#---------------------------------
 	# PEOPLE MOVEMENTS
 	#---------------------------------
 
+	def set_initial_push(self, indices, input_data):
+		""" Velocity imposed by chosing random angle and given norm """
+		vel_norm = input_data.initial_momentum / input_data.mass
+		angle = self.rng.uniform(0.0, 2.0*np.pi, len(indices))
+		vx, vy = utils.vel_components_from_angle(angle, vel_norm)
+		self.velocity[indices, 0] = vx
+		self.velocity[indices, 1] = vy
+
+
+
 	def move(self, dt):
 		""" Routine to update particles positions """
-		for part in self.particles_list:
-			part.move_particle(dt)
+		self.position += self.velocity * dt
 
 
 
 	def resolve_wall_collisions(self):
 		""" Reflect particles that are close to walls"""
 
-		# Loop on particles
-		for part in self.particles_list:
+		for k in range(2):
+
+			pos = self.position[:, k]
+			vel = self.velocity[:, k]
 
-			# x direction
-			if((part.x <= part.radius and part.vx<0)
-				or (part.x >= self.domain_size[0]-part.radius and part.vx>0)):
-				part.reflect_wall("x")
+			# Particles moving towards a wall they are touching
+			reflected = (((pos <= self.radius) & (vel < 0))
+						| ((pos >= self.domain_size[k]-self.radius) & (vel > 0)))
 
-			# y direction
-			if((part.y <= part.radius and part.vy<0)
-				or (part.y >= self.domain_size[1]-part.radius and part.vy>0)):
-				part.reflect_wall("y")
+			vel[reflected] = -vel[reflected]
 
 
 
 	def resolve_particle_collisions(self, time, input_data):
 
-		# Get positions matrix
-		position = self.get_position_matrix()
-		nop = self.Nb_particles
+		# Pairs of particles in contact
+		contact_i, contact_j, contact_unit, contact_norm = collisions.find_contacts(
+			self.get_position_matrix(), self.radius, self.domain_size, input_data.collision_backend)
+		self.nb_contacts = len(contact_i)
 
-		# make 3D arrays with repeated position vectors to form combinations
-		# diff_i[i][j] = position[i]
-		# diff_j[i][j] = position[j]
-		# diff[i][j] = vector pointing from i to j
-		# norm[i][j] = sqrt( diff[i][j]**2 )
-		diff_i = np.repeat(position.reshape(1, nop, 2) , nop, axis=1).reshape(nop, nop, 2)
-		diff_j = np.repeat(position.reshape(1, nop, 2) , nop, axis=0)
-		diff = diff_j - diff_i
-		norm = np.linalg.norm(diff, axis=2)
+		# Velocity reflections and push-outs for all contacts
+		collisions.resolve_contacts(self.position, self.velocity, self.radius,
+									contact_i, contact_j, contact_unit, contact_norm)
 
-		# make norm upper triangular (excluding diagonal)
-		# This prevents double counting the i,j and j,i pairs
-		collided = np.triu(norm <2.0 * self.radius, k=1)
+		# Propagating infection
+		self.transmit_infection(contact_i, contact_j, time, input_data)
 
-		for i, j in zip(*np.nonzero(collided)):
-			# unit vector from i to j
-			unit = diff[i][j] / norm[i][j]
 
-			# flip their velocity along the axis given by `unit`
-			# and reduce momentum on that axis by 10%
-			vel_diff_i = 2.0 * np.dot(unit, self.particles_list[i].V) * unit
-			self.particles_list[i].vx -= vel_diff_i[0]
-			self.particles_list[i].vy -= vel_diff_i[1]
-			#
-			vel_diff_j = 2.0 * np.dot(unit, self.particles_list[j].V) * unit
-			self.particles_list[j].vx -= vel_diff_j[0]
-			self.particles_list[j].vy -= vel_diff_j[1]
 
-			# Update velocities vectors
-			self.particles_list[i].V[0] = self.particles_list[i].vx
-			self.particles_list[i].V[1] = self.particles_list[i].vy
-			#
-			self.particles_list[j].V[0] = self.particles_list[j].vx
-			self.particles_list[j].V[1] = self.particles_list[j].vy
+	def transmit_infection(self, contact_i, contact_j, time, input_data):
+		""" Infection trials for all the contacts between a symptomatic and a susceptible person """
 
-			# push particle j to be 1 unit from i
-			dist_diff_j = ( 2.0 * self.radius - norm[i][j] ) * unit
-			self.particles_list[j].x  += dist_diff_j[0]
-			self.particles_list[j].y  += dist_diff_j[1]
+		# Each contact is tried in both directions (source infects target)
+		source = np.stack([contact_i, contact_j], axis=1).ravel()
+		target = np.stack([contact_j, contact_i], axis=1).ravel()
 
+		# Only persons with symptoms are contagious, only healthy unvaccinated persons can be infected
+		trial = (self.state[source]==2) & (self.state[target]==0) & ~self.has_flag(target, VACCINATED)
 
-			# Propagating infection: particle j
-			if ((self.particles_list[i].state==2) and
-				self.particles_list[j].state==0 and self.particles_list[j].is_vaccinated==False):
+		self.apply_infection_trials(source[trial], target[trial], time, input_data)
 
-				# Infection of particle j with a probability infection_contact_prob
-				rand_num = random.uniform(0.0, 1.0)
 
-				if rand_num < input_data.infection_contact_prob:
 
-					# Set state to infected without symptoms
-					self.particles_list[j].get_infected()
-					self.particles_list[j].set_infection_time(time)
+	def apply_infection_trials(self, source, target, time, input_data):
+		""" Infection of each target by its source (trials given in contact order) """
 
-					# Set a random incubation period
-					random_nb = random.uniform(0, 1)
-					incubation_period = utils.invert_cdf(random_nb, input_data.incubation_proba)
+		# Infection of target with a probability infection_contact_prob
+		success = self.rng.random(len(source)) < input_data.infection_contact_prob
+		source, target = source[success], target[success]
 
-					self.particles_list[j].set_incubation_period(incubation_period, input_data.saving_folder)
+		# A person in contact with several symptomatics is infected by the first one
+		target, first = np.unique(target, return_index=True)
+		source = source[first]
 
-					# Updating nb of particles infected by i
-					self.particles_list[i].nb_infections_provoked += 1
+		# Set state to infected without symptoms
+		self.infect(target, time, input_data)
 
-			# Propagating infection: particle i
-			if ((self.particles_list[j].state==2) and
-				self.particles_list[i].state==0 and self.particles_list[i].is_vaccinated==False):
+		# Updating nb of particles infected by sources
+		np.add.at(self.nb_infections_provoked, source, 1)
+		self.update_R_sums(self.infection_time[source], np.ones(len(source)), np.zeros(len(source)))
 
-				# Infection of particle j with a probability infection_contact_prob
-				rand_num = random.uniform(0.0, 1.0)
 
-				if rand_num < input_data.infection_contact_prob:
+	#---------------------------------
+	# PEOPLE CHANGE OF HEALTH STATE
+	#---------------------------------
 
-					# Set state to infected without symptoms
-					self.particles_list[i].get_infected()
-					self.particles_list[i].set_infection_time(time)
-					# Set a random incubation period
-					random_nb = random.uniform(0, 1)
-					incubation_period = utils.invert_cdf(random_nb, input_data.incubation_proba)
+	def infect(self, indices, time, input_data):
+		""" Infect given particles at given time and set a random incubation period """
 
-					self.particles_list[i].set_incubation_period(incubation_period, input_data.saving_folder)
+		# Set state to infected without symptoms
+		self.state[indices] = 1
+		self.infection_time[indices] = time
+		self.state_counts[0] -= len(indices)
+		self.state_counts[1] += len(indices)
+		self.nb_new_infections += len(indices)
 
-					# Updating nb of particles infected by j
-					self.particles_list[j].nb_infections_provoked += 1
+		# Set a random incubation period
+		random_nb = self.rng.random(len(indices))
+		incubation_period = input_data.incubation_sampler.sample(random_nb)
+		self.set_incubation_period(indices, incubation_period)
 
 
-	#---------------------------------
-	# PEOPLE CHANGE OF HEALTH STATE
-	#---------------------------------
 
 	def change_person_state(self, time, input_data):
 
-		# Loop on particles
-		for part in self.particles_list:
+		state = self.state
 
-			# Check if infected without symptoms will get symptoms
-			if part.state==1:
-				# Number of days between current time and infection time
-				delta_time_infection = time - part.infection_time
+		# Transitions due at current time (events scheduled during this step are handled next step)
+		kinds, part_ids = self.scheduler.pop_due(time)
+		indices = self.get_indices(part_ids)
+		self.nb_transitions = len(kinds)
 
-				if delta_time_infection >= part.incubation_period:
+		new_symptomatics = indices[kinds==scheduler.SYMPTOMS_ONSET]
+		recovered = indices[kinds==scheduler.RECOVERY]
+		die = indices[kinds==scheduler.DEATH]
 
-					# Get symptoms
-					part.get_symptoms()
+		if len(new_symptomatics)>0:
 
-					# Confine if measure is taken
-					if input_data.symptomatics_confinement:
-						self.confine_symptomatics()
+			# Get symptoms
+			state[new_symptomatics] = 2
+			self.state_counts[1] -= len(new_symptomatics)
+			self.state_counts[2] += len(new_symptomatics)
+			self.update_R_sums(self.infection_time[new_symptomatics], self.nb_infections_provoked[new_symptomatics],
+								np.ones(len(new_symptomatics)))
 
-					# Decide if the person will die or not and set death/recovery times
-					rand_die = random.uniform(0.0, 1.0)
-					if rand_die < input_data.mortality_rate:
-						part.will_die = True
-						# set duration after which person dies
-						# Set a random incubation period
-						random_nb = random.uniform(0, 1)
-						death_time = utils.invert_cdf(random_nb, input_data.onset_to_death_proba)
+			# Confine if measure is taken (only new symptomatics: the others are already frozen)
+			if input_data.symptomatics_confinement:
+				self.confine_symptomatics(new_symptomatics)
 
-						part.set_death_time(death_time, input_data.saving_folder)
-					else:  # person recovers
-						part.will_die = False
-						# set duration after which person recovers
-						random_nb = random.uniform(0, 1)
-						recover_time = utils.invert_cdf(random_nb, input_data.onset_to_recov_proba)
+			# Decide if the person will die or not and set death/recovery times
+			rand_die = self.rng.random(len(new_symptomatics))
+			self.set_flag(new_symptomatics, WILL_DIE, rand_die < input_data.mortality_rate)
 
-						part.set_recovery_time(recover_time, input_data.saving_folder)
+			# set duration after which person dies
+			dying = new_symptomatics[rand_die < input_data.mortality_rate]
+			death_time = input_data.onset_to_death_sampler.sample(self.rng.random(len(dying)))
+			self.set_death_time(dying, death_time)
 
-			# Person with symptoms
-			elif part.state==2:
+			# set duration after which person recovers
+			recovering = new_symptomatics[rand_die >= input_data.mortality_rate]
+			recover_time = input_data.onset_to_recov_sampler.sample(self.rng.random(len(recovering)))
+			self.set_recovery_time(recovering, recover_time)
 
-				# Number of days between current time and declaration of symptoms
-				incubation_time = part.infection_time + part.incubation_period
-				delta_time_symptoms = time - incubation_time
+		# Persons with symptoms recovering or dying are not counted in R anymore
+		ending = np.concatenate([recovered, die])
+		self.update_R_sums(self.infection_time[ending], -self.nb_infections_provoked[ending], -np.ones(len(ending)))
 
-				# Check if person with symptoms recovers
-				if part.will_die==False:
-					if delta_time_symptoms >= part.recovery_time:
-						# Recover
-						part.recover()
+		# Recover
+		state[recovered] = 3
+		self.state_counts[2] -= len(recovered)
+		self.state_counts[3] += len(recovered)
 
-						# If confinement measures were take for symptomatics;
-						# we enable person to go out again
-						# Warning: not allowed if preventively confined
-						if input_data.symptomatics_confinement and part.is_prev_confined==False:
-							part.set_initial_push(input_data)
+		# If confinement measures were take for symptomatics;
+		# we enable person to go out again
+		# Warning: not allowed if preventively confined
+		if input_data.symptomatics_confinement:
+			self.set_initial_push(recovered[~self.has_flag(recovered, PREV_CONFINED)], input_data)
+
+		# Death
+		state[die] = 4
+		self.state_counts[2] -= len(die)
+		self.state_counts[4] += len(die)
+
+
+
+	def set_incubation_period(self, indices, time):
+		# Setting incubation time
+		self.incubation_period[indices] = time
+		# Scheduling symptoms onset
+		self.scheduler.push(self.infection_time[indices] + time, scheduler.SYMPTOMS_ONSET, self.part_id[indices])
+		# We record incubation times in the event log
+		self.event_log.record("incubation", time)
+
+
+	def set_death_time(self, indices, time):
+		self.death_time[indices] = time
+		# Scheduling death (time counted from symptoms onset)
+		onset_time = self.infection_time[indices] + self.incubation_period[indices]
+		self.scheduler.push(onset_time + time, scheduler.DEATH, self.part_id[indices])
+		# We record death times in the event log
+		self.event_log.record("onset_to_death", time)
+
+
+	def set_recovery_time(self, indices, time):
+		self.recovery_time[indices] = time
+		# Scheduling recovery (time counted from symptoms onset)
+		onset_time = self.infection_time[indices] + self.incubation_period[indices]
+		self.scheduler.push(onset_time + time, scheduler.RECOVERY, self.part_id[indices])
+		# We record recovery times in the event log
+		self.event_log.record("onset_to_recovery", time)
 
-				# Check if person with symptoms dies
-				else:
-					if delta_time_symptoms >= part.death_time:
-						# Death
-						part.die()
-                        
 
 
 	def remove_deads(self):
 
-		# Loop and check particles with state 4 (death)
-		for part in self.particles_list:
-			if part.state==4:
-				self.particles_list.remove(part)
+		# Dead persons still in the arrays (all deaths minus those already removed)
+		nb_deads = self.state_counts[4] - (self.population_size - self.Nb_particles)
+		if nb_deads==0:
+			return
 
-		# Updating population size
-		self.Nb_particles = len(self.particles_list)
+		# Particles with state 4 (death) are removed from every column in a single pass
+		# The order of remaining particles is kept (ids stay sorted)
+		dead = self.state==4
+		alive = np.nonzero(~dead)[0]
+		nb_alive = len(alive)
+
+		self.index_of_id[self.part_id[dead]] = -1
+
+		for name in self.columns:
+			column = getattr(self, name)
+			column[:nb_alive] = column[alive]
+		self.set_columns_length(nb_alive)
+
+		# Updating indices of remaining particles and population size
+		self.index_of_id[self.part_id] = np.arange(nb_alive)
+		self.Nb_particles = nb_alive
 
 
 	#---------------------------------
 	# PREVENTION MEASURES
 	#---------------------------------
 
-	def confine_symptomatics(self):
-		# Loop and check particles with state 2 (persons with symptoms)
-		for part in self.particles_list:
-			if part.state==2:
-				part.freeze()
+	def confine_symptomatics(self, indices=None):
+		# Freeze given particles, by default all particles with state 2 (persons with symptoms)
+		# A frozen particle stays frozen: collisions and walls only reflect its zero velocity
+		if indices is None:
+			indices = np.nonzero(self.state==2)[0]
+		self.velocity[indices] = 0.0
 
 
 	def set_preventive_confinement(self, input_data):
 		# Confine a proportion of the population
 		# No need to shuffle as particles positions are already random
 		nb_confined = int(input_data.preventive_confinement*input_data.population_size)
-		for part in self.particles_list:
-			if part.part_id<nb_confined:
-				part.freeze()
-				part.is_prev_confined = True
+		confined = self.part_id<nb_confined
+		self.velocity[confined] = 0.0
+		self.set_flag(confined, PREV_CONFINED)
 
 
 	def perform_vaccination_campaign(self, input_data):
 		# Vaccine a proportion of the population
 		# No need to shuffle as particles positions are already random
 		nb_vaccined = int(input_data.vaccination_rate*input_data.population_size)
-		for part in self.particles_list:
-			if part.part_id<nb_vaccined:
-				part.is_vaccinated = True
+		self.set_flag(self.part_id<nb_vaccined, VACCINATED)
 
 	#---------------------------------
 	# POPULATION STATE
 	#---------------------------------
 
 	def check_if_infected(self):
-
-		pop_infected = False
-
-		for part in self.particles_list:
-			if part.state==1 or part.state==2:
-				pop_infected = True
-				break
-
-		return pop_infected
+		return self.state_counts[1] + self.state_counts[2] > 0
 
 	#---------------------------------
 	# R-FACTOR COMPUTATION
 	#---------------------------------
 
-	def compute_R_factor(self, time, input_data):
-		""" Computation of effective reproduction factor R """
+	def update_R_sums(self, infection_times, nb_infections, nb_symptomatics):
+		""" Add contributions of persons with symptoms to the running sums of R estimator """
 
-		# Initializing numerator and denominator
-		total_nb_infected = 0
-		total_nb_estimated_transmissions = 0
+		if len(infection_times)==0:
+			return
 
-		# Loop on particles
-		for part in self.particles_list:
-			if part.state==2:
+		# Grouping contributions by infection time
+		keys, inverse = np.unique(infection_times, return_inverse=True)
+		sum_symptomatics = np.rint(np.bincount(inverse, weights=nb_symptomatics, minlength=len(keys))).astype(int)
+		sum_infections = np.rint(np.bincount(inverse, weights=nb_infections, minlength=len(keys))).astype(int)
 
-				# Adding to total number of particles infected
-				total_nb_infected += 1
+		for key, nb_sympt, nb_inf in zip(keys.tolist(), sum_symptomatics.tolist(), sum_infections.tolist()):
+			entry = self.R_sums.setdefault(key, [0, 0])
+			entry[0] += nb_sympt
+			entry[1] += nb_inf
+			# No more person with symptoms infected at that time
+			if entry[0]==0:
+				del self.R_sums[key]
 
-				# Infection duration so far
-				infected_since = time - part.infection_time
-				# Number of persons infected so far
-				nb_infected = part.nb_infections_provoked
 
-				# Modeling the infection duration
-				mean_duration_before_death = input_data.mean_onset_to_death
-				mean_duration_before_recov = input_data.mean_onset_to_recov
-				mean_infection_duration = input_data.mortality_rate*mean_duration_before_death + (1.0-input_data.mortality_rate)*mean_duration_before_recov
 
-				# Estimation of the number of infections during the total period
-				if infected_since==0.0:
-					nb_estimated_transmissions = 0.0
-				else:
-					nb_estimated_transmissions = (mean_infection_duration*nb_infected)/infected_since
+	def compute_R_factor(self, time, input_data):
+		""" Computation of effective reproduction factor R (from running sums, without loop on particles) """
 
-				# Number of total estimated transmission for the period of infection
-				total_nb_estimated_transmissions += nb_estimated_transmissions
+		# Number of particles infected
+		total_nb_infected = self.state_counts[2]
 
 		# R factor (by definition, if denom is zero, R is 0)
 		if(total_nb_infected==0):
 			self.R_factor = 0.0
-		else:
-			self.R_factor = total_nb_estimated_transmissions / total_nb_infected
+			return self.R_factor
+
+		# Infection duration so far and number of persons infected so far (by infection time)
+		infection_times = np.array(list(self.R_sums.keys()))
+		nb_infected = np.array([entry[1] for entry in self.R_sums.values()])
+		infected_since = time - infection_times
+
+		# Modeling the infection duration
+		mean_duration_before_death = input_data.mean_onset_to_death
+		mean_duration_before_recov = input_data.mean_onset_to_recov
+		mean_infection_duration = input_data.mortality_rate*mean_duration_before_death + (1.0-input_data.mortality_rate)*mean_duration_before_recov
+
+		# Estimation of the number of infections during the total period (zero if infected right now)
+		started = infected_since!=0.0
+		nb_estimated_transmissions = (mean_infection_duration*nb_infected[started])/infected_since[started]
 
+		# Number of total estimated transmission for the period of infection
+		total_nb_estimated_transmissions = np.sum(nb_estimated_transmissions)
+
+		self.R_factor = total_nb_estimated_transmissions / total_nb_infected
 
 		return self.R_factor
 
@@ -347,57 +630,53 @@ class particles_cloud(object):
 	# SECONDARY ROUTINES
 	#---------------------------------
 
+	def get_indices(self, part_ids):
+		""" Current indices of particles with given ids (raises LookupError if one is removed) """
+		indices = self.index_of_id[part_ids]
+		if np.any(indices < 0):
+			raise LookupError(f"Removed particles: {np.asarray(part_ids)[indices < 0]}")
+		return indices
+
+
+
 	def get_position_matrix(self):
 		""" Get matrix with particles position"""
+		return self.position
 
-		X = np.zeros((self.Nb_particles, 2))
 
-		for i in range(self.Nb_particles):
-			X[i,0] = self.particles_list[i].x
-			X[i,1] = self.particles_list[i].y
 
-		return X
+	def close_outputs(self):
+		""" Write buffered outputs at the end of the run """
+		self.event_log.flush()
+		self.time_series.close()
+		if self.trajectory is not None:
+			self.trajectory.close()
+			self.trajectory = None
 
 
 
-	def export_state_to_file(self, time, nb_timestep, save_folder):
-		""" Function to save state in h5 file """
-
-		# Creating vectors with particles_data
-		PartID_vect = np.zeros(self.Nb_particles)
-		X_vect = np.zeros(self.Nb_particles)
-		Y_vect = np.zeros(self.Nb_particles)
-		VX_vect = np.zeros(self.Nb_particles)
-		VY_vect = np.zeros(self.Nb_particles)
-		PartState_vect = np.zeros(self.Nb_particles)
-		#
-		for i in range(self.Nb_particles):
-			PartID_vect[i] = self.particles_list[i].part_id
-			X_vect[i] = self.particles_list[i].x
-			Y_vect[i] = self.particles_list[i].y
-			VX_vect[i] = self.particles_list[i].vx
-			VY_vect[i] = self.particles_list[i].vy
-			PartState_vect[i] = self.particles_list[i].state
-
-		# File to store data of current iteration
-		file_data = save_folder + "/solutions/solution_step_{:04d}_{:3.2f}days.h5".format(nb_timestep, time)
-
-		# Open h5 file to write inside
-		hf = h5py.File(file_data, 'w')
-
-		# Writing datasets in file
-		hf.create_dataset('TIME', data=np.array((time)))
-		hf.create_dataset('NB_TIMESTEP', data=np.array((nb_timestep)))
-		hf.create_dataset('ID', data=PartID_vect)
-		hf.create_dataset('X', data=X_vect)
-		hf.create_dataset('Y', data=Y_vect)
-		hf.create_dataset('VX', data=VX_vect)
-		hf.create_dataset('VY', data=VY_vect)
-		hf.create_dataset('STATE', data=PartState_vect)
-		hf.create_dataset('R_FACTOR', data=np.array((self.R_factor)))
-
-		# Close file
-		hf.close()
+	def record_time_series(self, time, nb_timestep):
+		""" Append current counts and R factor to the per-step time series """
+		self.time_series.append(time, nb_timestep, self.state_counts, self.nb_new_infections, self.R_factor)
+		self.nb_new_infections = 0
+
+
+
+	def get_snapshot(self, time):
+		""" Copy of the data needed to plot current state """
+		return {"TIME": time, "R_FACTOR": self.R_factor, "COUNTS": self.state_counts.copy(),
+				"X": self.position[:,0].copy(), "Y": self.position[:,1].copy(), "STATE": self.state.copy()}
 
 
 
+	def export_state_to_file(self, time, nb_timestep, save_folder):
+		""" Function to append state to the trajectory h5 file """
+
+		# File storing all snapshots (opened at first snapshot)
+		if self.trajectory is None:
+			self.trajectory = trajectory_writer(save_folder + "/trajectory.h5")
+
+		# Writing particles data
+		self.trajectory.append(time, nb_timestep, self.R_factor, self.state_counts,
+								{"ID": self.part_id, "X": self.position[:,0], "Y": self.position[:,1],
+								"VX": self.velocity[:,0], "VY": self.velocity[:,1], "STATE": self.state})
@@ -1,121 +1,120 @@
 import os
 import shutil
-import glob
-
-import h5py
+import subprocess
+import multiprocessing
+from queue import Full
 
 import numpy as np
 import matplotlib.pyplot as plt
+import matplotlib.image as mpimg
 from matplotlib.collections import EllipseCollection
 
+from trajectory import trajectory_reader
+from time_series import load_time_series
+
 
 #---------------------------------
 # PLOTTING FUNCTIONS
 #---------------------------------
 
+def compute_stacked_areas(counts):
+	""" Cumulative vectors used in stacked area plot (counts: healthy, infected without/with symptoms, recovered, dead) """
+
+	state_2 = counts[:, 2]
+	state_2_1 = state_2 + counts[:, 1]
+	state_2_1_4 = state_2_1 + counts[:, 4]
+	state_2_1_4_0 = state_2_1_4 + counts[:, 0]
+	state_2_1_4_0_3 = state_2_1_4_0 + counts[:, 3]
+
+	return (state_2, state_2_1, state_2_1_4, state_2_1_4_0, state_2_1_4_0_3)
+
+
+
+def compute_statistics(input_data):
+	""" Per-step time series of the number of persons in each state (read once from time_series.h5) """
+
+	series = load_time_series(input_data.saving_folder)
+	counts = series["counts"]
+
+	return {"time": series["time"], "counts": counts, "stacked": compute_stacked_areas(counts)}
+
+
+
 def create_png_images(time_end, input_data):
+	""" Render one frame per snapshot: saved as PNG images (if save_png_images)
+	 and/or streamed to ffmpeg (if video_mode is "stream") """
 
-	# Vectors used in plots
-	time_vect = []
-	healthy_vect = []
-	infected_wo_sympt_vect = []
-	infected_with_sympt_vect = []
-	recovered_vect = []
-	deaths_vect = []
-	R_factor_vect = []
-
-	# Loop on data files
-	filelist = glob.glob(input_data.saving_folder + '/solutions/*.h5')
-	nb_files = len(filelist) # Total number of files
-	i_file = 0  # Current file number
-	for filename in sorted(filelist):
-
-		# Opening h5 file
-		hf = h5py.File(filename, 'r')
-
-		# Getting desired datasets
-		time = hf.get('TIME')[()]
-		nb_timestep = hf.get('NB_TIMESTEP')[()]
-		X_vect = hf.get('X')[()]
-		Y_vect = hf.get('Y')[()]
-		PartState_vect = hf.get('STATE')[()]
-		R_factor = hf.get('R_FACTOR')[()]
-
-		# Closing h5 file
-		hf.close()
-
-
-		# Number of particles
-		Nb_part = len(X_vect)
-
-
-		# Getting statistics: healthy, infected, etc...
-		nb_healthy = 0
-		nb_infected_wo_sympt = 0
-		nb_infected_with_sympt = 0
-		nb_recovered = 0
-		for i in range(Nb_part):
-			a = PartState_vect[i]
-			if a==0:
-				nb_healthy += 1
-			elif a==1:
-				nb_infected_wo_sympt += 1
-			elif a==2:
-				nb_infected_with_sympt += 1
-			elif a==3:
-				nb_recovered += 1
-
-		nb_deaths = input_data.population_size - Nb_part
-
-
-		# Appending to vectors
-		time_vect.append(time)
-		healthy_vect.append(nb_healthy)
-		infected_wo_sympt_vect.append(nb_infected_wo_sympt)
-		infected_with_sympt_vect.append(nb_infected_with_sympt)
-		recovered_vect.append(nb_recovered)
-		deaths_vect.append(nb_deaths)
-		R_factor_vect.append(R_factor)
-
-		# Cumulative vectors
-		state_2 = np.array(infected_with_sympt_vect)
-		state_2_1 = state_2 + np.array(infected_wo_sympt_vect)
-		state_2_1_4 = state_2_1 + np.array(deaths_vect)
-		state_2_1_4_0 = state_2_1_4 + np.array(healthy_vect)
-		state_2_1_4_0_3 = state_2_1_4_0 + np.array(recovered_vect)
-
-
-		# RGB colors for each state
-		color_s0 = (0, 0.44, 0.87, 1)
-		color_s1 = (1.0, 0.46, 0, 1)
-		color_s2 = (1.0, 0, 0.4, 1)
-		color_s3 = (0.63, 0, 0.87, 1)
-		color_s4 = (0.0, 0.0, 0.0, 1)
-
-		# Creating matplotlib figures
-		fig = plt.figure(constrained_layout=True)
-		gs = fig.add_gridspec(3, 2)
-
-		ax0 = fig.add_subplot(gs[0, 0])
-		ax1 = fig.add_subplot(gs[0, 1])
-		ax2 = fig.add_subplot(gs[1:, :])
+	trajectory_file = input_data.saving_folder + "/trajectory.h5"
 
-		# GLOBAL STATISTICS
-		ax1.fill_between(time_vect, 0, state_2, color=color_s2, alpha=0.5)
-		ax1.fill_between(time_vect, state_2, state_2_1, color=color_s1, alpha=0.5)
-		ax1.fill_between(time_vect, state_2_1, state_2_1_4, color=color_s4, alpha=0.5)
-		ax1.fill_between(time_vect, state_2_1_4, state_2_1_4_0, color=color_s0, alpha=0.5)
-		ax1.fill_between(time_vect, state_2_1_4_0, state_2_1_4_0_3, color=color_s3, alpha=0.5)
+	# Time series of states (computed once for all frames)
+	statistics = compute_statistics(input_data)
+	trajectory = trajectory_reader(trajectory_file)
+	nb_files = trajectory.nb_snapshots
+	trajectory.close()
 
-		# Last image, we display the peak value of infected people
-		if(i_file==nb_files-1):
-			# Array of total infected people
-			index_max_infected, max_infected = np.argmax(infected_with_sympt_vect), np.max(infected_with_sympt_vect)
+	# Frames are streamed in order to ffmpeg
+	video = open_video(input_data)
+
+	# Frames are rendered in parallel (one frame per snapshot)
+	nb_workers = input_data.nb_render_workers or os.cpu_count()
+	init_args = (trajectory_file, time_end, input_data, statistics, video is not None)
+	if nb_workers==1:
+		# Rendering in this process: trajectory file and figure are closed afterwards
+		try:
+			init_render_worker(*init_args)
+			frames = map(render_frame, range(nb_files))
+			write_frames(frames, video)
+		finally:
+			close_render_worker()
+	else:
+		with multiprocessing.Pool(nb_workers, initializer=init_render_worker, initargs=init_args) as pool:
+			frames = pool.imap(render_frame, range(nb_files), chunksize=max(1, nb_files//(4*nb_workers)))
+			write_frames(frames, video)
 
-			ax1.plot([time_vect[index_max_infected]],[max_infected],
-						 marker="o", markersize=3, color='k')
-			ax1.text(time_vect[index_max_infected], 1.2*max_infected,
-						f"Peak = {max_infected}", fontsize = 6)
+	if video is not None:
+		video.close()
+
+
+
+def write_frames(frames, video):
+	# Consuming rendered frames (in order), sending them to video if any
+	for frame in frames:
+		if video is not None:
+			video.write(frame)
+
+
+
+# RGB colors for each state
+color_s0 = (0, 0.44, 0.87, 1)
+color_s1 = (1.0, 0.46, 0, 1)
+color_s2 = (1.0, 0, 0.4, 1)
+color_s3 = (0.63, 0, 0.87, 1)
+color_s4 = (0.0, 0.0, 0.0, 1)
+state_colors = np.array([color_s0, color_s1, color_s2, color_s3, color_s4])
+
+
+class frame_renderer(object):
+	""" Figure built once: for each snapshot only the population collection,
+	 the stacked areas and the R title are updated """
+
+	def __init__(self, time_end, input_data):
+
+		# Creating matplotlib figures (canvas resolution is the one of images)
+		self.fig = plt.figure(constrained_layout=True, dpi=250)
+		gs = self.fig.add_gridspec(3, 2)
+
+		ax0 = self.fig.add_subplot(gs[0, 0])
+		ax1 = self.fig.add_subplot(gs[0, 1])
+		ax2 = self.fig.add_subplot(gs[1:, :])
+
+		# GLOBAL STATISTICS
+		# Stacked areas (from bottom to top: symptoms, no symptoms, deaths, healthy, recovered)
+		self.areas = [ax1.fill_between([0.0], [0.0], [0.0], color=color, alpha=0.5)
+						for color in (color_s2, color_s1, color_s4, color_s0, color_s3)]
+
+		# Peak value of infected people (displayed on last image)
+		self.peak_marker, = ax1.plot([], [], marker="o", markersize=3, color='k')
+		self.peak_text = ax1.text(0.0, 0.0, "", fontsize = 6)
 
 		ax1.set_xlim(0.0, time_end)
 		ax1.set_ylim(0, input_data.population_size)
@@ -125,7 +124,7 @@ def create_png_images(time_end, input_data):
 		# Setting only min and max ticks
 		ax1.set_xticks([0.0, time_end])
 		ax1.set_yticks([0.0, input_data.population_size])
-		
+
 		# labels
 		ax1.set_xlabel("Time [days]", fontsize=8)
 		ax1.set_ylabel("Population [-]", fontsize=8)
@@ -135,31 +134,16 @@ def create_png_images(time_end, input_data):
 		# collection related quantities
 		size = 2.0*input_data.radius
 
-		# color function of states
-		color = []
-		for i in range(Nb_part):
-			if PartState_vect[i]==0:
-				color.append(color_s0)
-			elif PartState_vect[i]==1:
-				color.append(color_s1)
-			elif PartState_vect[i]==2:
-				color.append(color_s2)
-			elif PartState_vect[i]==3:
-				color.append(color_s3)
-
-		# data
-		offsets = list(zip(X_vect, Y_vect))
-
 		# Plot with points respecting given radius
-		ec = EllipseCollection(widths=size, heights=size, angles=0, units='xy',
-                                       offsets=offsets, transOffset=ax2.transData)
-		ec.set_facecolor(color)
-		ec.set_edgecolor(color)
+		self.population = EllipseCollection(widths=size, heights=size, angles=0, units='xy',
+											offsets=np.zeros((0, 2)), transOffset=ax2.transData)
 
-		ax2.add_collection(ec)
+		ax2.add_collection(self.population)
+		ax2.set_xlim(-size, input_data.domain_size[0]+size)
+		ax2.set_ylim(-size, input_data.domain_size[1]+size)
 
-		# show R factor
-		ax2.set_title(f"$R = {R_factor:.2f}$", fontsize=8)
+		# R factor
+		self.R_title = ax2.set_title("", fontsize=8)
 
 		# Disabling axis
 		ax2.axes.get_yaxis().set_visible(False)
@@ -196,17 +180,237 @@ def create_png_images(time_end, input_data):
 		ax0.set_aspect("equal")
 
 
-		# Finalizing
-		# fig.tight_layout()
-		fig.savefig(input_data.saving_folder + "/images/image_step_{:05d}.png".format(i_file), dpi=250)
-		plt.close(fig)
+	def update(self, snapshot, time_vect, stacked, infected_with_sympt_vect, show_peak):
+		""" Update artists with a snapshot and the time series up to this snapshot """
+
+		# GLOBAL STATISTICS
+		bottom = np.zeros(len(time_vect))
+		for area, top in zip(self.areas, stacked):
+			verts = np.concatenate([np.column_stack([time_vect, bottom]),
+									np.column_stack([time_vect[::-1], top[::-1]])])
+			area.set_verts([verts])
+			bottom = top
+
+		# Last image, we display the peak value of infected people
+		self.peak_marker.set_visible(show_peak)
+		self.peak_text.set_visible(show_peak)
+		if show_peak:
+			index_max_infected, max_infected = np.argmax(infected_with_sympt_vect), np.max(infected_with_sympt_vect)
+			self.peak_marker.set_data([time_vect[index_max_infected]], [max_infected])
+			self.peak_text.set_position((time_vect[index_max_infected], 1.2*max_infected))
+			self.peak_text.set_text(f"Peak = {max_infected}")
+
+		# REPRESENTATION OF POPULATION
+		# color function of states
+		color = state_colors[snapshot["STATE"]]
+		self.population.set_offsets(np.column_stack([snapshot["X"], snapshot["Y"]]))
+		self.population.set_facecolor(color)
+		self.population.set_edgecolor(color)
+
+		# show R factor
+		self.R_title.set_text(f"$R = {snapshot['R_FACTOR']:.2f}$")
+
+
+	def render(self):
+		""" Draw figure and return its RGB pixels """
+		self.fig.canvas.draw()
+		return np.asarray(self.fig.canvas.buffer_rgba())[:, :, :3].copy()
+
+
+	def close(self):
+		plt.close(self.fig)
+
+
+
+# Data shared by all frames rendered by a worker process
+render_context = {}
+
+
+def init_render_worker(trajectory_file, time_end, input_data, statistics, return_frames):
+	render_context["trajectory"] = trajectory_reader(trajectory_file)
+	render_context["return_frames"] = return_frames
+	render_context["input_data"] = input_data
+	render_context["statistics"] = statistics
+	render_context["renderer"] = frame_renderer(time_end, input_data)
+
+
+
+def close_render_worker():
+	if "trajectory" in render_context:
+		render_context["trajectory"].close()
+	if "renderer" in render_context:
+		render_context["renderer"].close()
+	render_context.clear()
+
+
+
+def render_frame(i_file):
+	""" Render image of snapshot i_file with the figure of the worker
+	 (RGB pixels are returned if frames are streamed to video) """
+
+	trajectory = render_context["trajectory"]
+	input_data = render_context["input_data"]
+	statistics = render_context["statistics"]
+	renderer = render_context["renderer"]
+
+	# Getting desired datasets
+	snapshot = trajectory.read_snapshot(i_file, ("X", "Y", "STATE"))
+
+	# Time series up to current snapshot
+	n = np.searchsorted(statistics["time"], snapshot["TIME"], side="right")
+	time_vect = statistics["time"][:n]
+	infected_with_sympt_vect = statistics["counts"][:n, 2]
+	stacked = [v[:n] for v in statistics["stacked"]]
+
+	frame = draw_frame(renderer, i_file, snapshot, time_vect, stacked, infected_with_sympt_vect,
+						i_file==trajectory.nb_snapshots-1, input_data)
+
+	if render_context["return_frames"]:
+		return frame
+
 
-		# Next file
-		i_file += 1
 
-	# Create a last plot with R factor against time
-	plot_R_factor(input_data, time_vect, R_factor_vect)
+def draw_frame(renderer, i_file, snapshot, time_vect, stacked, infected_with_sympt_vect, is_last, input_data):
+	""" Update and draw renderer, save PNG image if asked and return RGB pixels """
 
+	renderer.update(snapshot, time_vect, stacked, infected_with_sympt_vect, is_last)
+	frame = renderer.render()
+
+	# PNG image written from rendered pixels
+	if input_data.save_png_images:
+		mpimg.imsave(input_data.saving_folder + "/images/image_step_{:05d}.png".format(i_file), frame, dpi=250)
+
+	return frame
+
+
+
+#---------------------------------
+# RENDERING DURING SIMULATION
+#---------------------------------
+
+class pipelined_renderer(object):
+	""" Process rendering snapshots while the simulation goes on
+
+	 Snapshots are sent through a bounded queue: the simulation waits when
+	 render_queue_size snapshots are pending, which bounds memory. As the final time
+	 is unknown during the run, the time axis of the stacked area plot goes to t_max
+	 and stacked areas are drawn from the counts sent with the snapshots. """
+
+	def __init__(self, input_data):
+		self.queue = multiprocessing.Queue(maxsize=input_data.render_queue_size)
+		self.process = multiprocessing.Process(target=render_pipeline, args=(self.queue, input_data))
+		self.process.start()
+
+
+	def submit(self, snapshot):
+		""" Send a snapshot (dictionary with TIME, R_FACTOR, COUNTS, X, Y, STATE) """
+		self.put(snapshot)
+
+
+	def put(self, item):
+		""" Wait for a place in the queue, as long as the rendering process is running
+		 (a stopped process would never empty it) """
+
+		while True:
+			if not self.process.is_alive():
+				raise RuntimeError(f"Rendering process stopped (exit code {self.process.exitcode})")
+			try:
+				self.queue.put(item, timeout=1.0)
+				return
+			except Full:
+				pass
+
+
+	def finish(self):
+		""" Wait for all frames (and video) to be written
+
+		 Raises RuntimeError if the rendering process failed. """
+
+		if self.process.is_alive():
+			try:
+				self.put(None)
+			except RuntimeError:
+				pass
+		self.process.join()
+
+		if self.process.exitcode!=0:
+			# Snapshots left in the queue are dropped
+			self.queue.cancel_join_thread()
+			raise RuntimeError(f"Rendering of frames failed (exit code {self.process.exitcode})")
+
+
+
+def render_pipeline(queue, input_data):
+	""" Consumer of snapshots: frames are rendered as they arrive """
+
+	renderer = frame_renderer(input_data.t_max, input_data)
+	video = open_video(input_data)
+
+	# Time series received so far
+	time_vect = []
+	counts_vect = []
+
+	# A frame is drawn when next snapshot arrives, to know if it is the last one
+	previous = None
+	i_file = 0
+	while True:
+		snapshot = queue.get()
+
+		if previous is not None:
+			counts = np.array(counts_vect)
+			frame = draw_frame(renderer, i_file, previous, np.array(time_vect), compute_stacked_areas(counts),
+								counts[:, 2], snapshot is None, input_data)
+			if video is not None:
+				video.write(frame)
+			i_file += 1
+
+		if snapshot is None:
+			break
+
+		time_vect.append(snapshot["TIME"])
+		counts_vect.append(snapshot["COUNTS"])
+		previous = snapshot
+
+	if video is not None:
+		video.close()
+	renderer.close()
+
+
+
+
+def plot_time_series(input_data):
+	""" Summary curves of the run read from per-step time series (no snapshot needed):
+	 R factor against time and stacked areas of the number of persons in each state """
+
+	series = load_time_series(input_data.saving_folder)
+
+	plot_R_factor(input_data, series["time"], series["R_factor"])
+	plot_compartments(input_data, series["time"], series["counts"])
+
+
+
+def plot_compartments(input_data, time_vect, counts):
+
+	fig, ax = plt.subplots()
+
+	# Stacked areas (from bottom to top: symptoms, no symptoms, deaths, healthy, recovered)
+	bottom = np.zeros(len(time_vect))
+	for top, color, label in zip(compute_stacked_areas(counts), (color_s2, color_s1, color_s4, color_s0, color_s3),
+								("Infected with symptoms", "Infected without symptoms", "Dead", "Healthy", "Recovered")):
+		ax.fill_between(time_vect, bottom, top, color=color, alpha=0.5, label=label)
+		bottom = top
+
+	ax.set_xlim(0.0, time_vect[-1] if len(time_vect)>0 else 1.0)
+	ax.set_ylim(0, input_data.population_size)
+
+	ax.set_xlabel("Time [days]", fontsize =12)
+	ax.set_ylabel("Population [-]", fontsize =12)
+
+	ax.legend(fontsize=8, loc="lower left")
+
+	fig.tight_layout()
+	fig.savefig(input_data.saving_folder + "/compartments_evolution.png", dpi=500)
+	plt.close(fig)
 
 
 
@@ -223,15 +427,65 @@ def plot_R_factor(input_data, time_vect, R_factor_vect):
 
 	fig.tight_layout()
 	fig.savefig(input_data.saving_folder + "/R_evolution.png", dpi=500)
+	plt.close(fig)
 
 #---------------------------------
 # VIDEO GENERATION
 #---------------------------------
 
+def open_video(input_data):
+	""" Video writer if frames are streamed to ffmpeg, else None """
+
+	if input_data.video_mode!="stream":
+		return None
+
+	if shutil.which("ffmpeg") is None:
+		print(">> ffmpeg not found: no video generated\n")
+		return None
+
+	return video_writer(input_data.saving_folder + "/movie.mp4")
+
+
+
+class video_writer(object):
+	""" ffmpeg process encoding raw RGB frames received on its standard input """
+
+	def __init__(self, filename, frame_rate=20):
+		self.filename = filename
+		self.frame_rate = frame_rate
+		self.process = None
+
+
+	def write(self, frame):
+
+		# ffmpeg is started at first frame, once the frame size is known
+		if self.process is None:
+			height, width = frame.shape[0], frame.shape[1]
+			command = ["ffmpeg", "-y", "-loglevel", "error",
+						"-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(self.frame_rate),
+						"-i", "-",
+						"-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-vcodec", "mpeg4", self.filename]
+			self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+		self.process.stdin.write(frame.tobytes())
+
+
+	def close(self):
+		if self.process is not None:
+			self.process.stdin.close()
+			self.process.wait()
+
+
+
 def generate_video(input_data):
+	""" Encode video from saved PNG images (video_mode "png") """
+
+	if input_data.video_mode!="png":
+		return
 
-	os.chdir(input_data.saving_folder + "/images")
-	os.system("ffmpeg -r 20 -i image_step_%05d.png -vcodec mpeg4 -y movie.mp4")
-	os.chdir("../..")
-	shutil.move(input_data.saving_folder + "/images/movie.mp4", input_data.saving_folder + "/movie.mp4")
+	if shutil.which("ffmpeg") is None:
+		print(">> ffmpeg not found: no video generated\n")
+		return
 
+	subprocess.run(["ffmpeg", "-r", "20", "-i", input_data.saving_folder + "/images/image_step_%05d.png",
+					"-vcodec", "mpeg4", "-y", input_data.saving_folder + "/movie.mp4"])
@@ -0,0 +1,107 @@
+import json
+from time import perf_counter
+
+import numpy as np
+
+
+# Phases of the time loop and per-step counters
+# (domain_advance: move, walls, contacts and infections run by the domain decomposition engine)
+loop_phases = ("move", "wall_collisions", "particle_collisions", "domain_advance", "change_person_state",
+				"remove_deads", "compute_R_factor", "export", "time_series", "check_if_infected", "checkpoint")
+loop_counters = ("nb_particles", "contact_pairs", "infections", "transitions")
+
+
+class loop_profiler(object):
+	""" Wall time of each phase of the time loop and counters, for each step
+
+	 At each step, start_step() is called, then lap(phase) at the end of each phase:
+	 the time since previous lap is added to the phase. Phases not run during a step
+	 have a zero time. When disabled, all calls return immediately. """
+
+	def __init__(self, enabled=True):
+
+		self.enabled = enabled
+
+		# Per-step values (one list per phase or counter)
+		self.step_time = []
+		self.times = {phase: [] for phase in loop_phases}
+		self.counters = {name: [] for name in loop_counters}
+
+		self.last = None
+
+
+	def start_step(self, time):
+
+		if not self.enabled:
+			return
+
+		self.step_time.append(time)
+		for phase in loop_phases:
+			self.times[phase].append(0.0)
+		for name in loop_counters:
+			self.counters[name].append(0)
+
+		self.last = perf_counter()
+
+
+	def lap(self, phase):
+
+		if not self.enabled:
+			return
+
+		now = perf_counter()
+		self.times[phase][-1] += now - self.last
+		self.last = now
+
+
+	def count(self, name, value):
+
+		if not self.enabled:
+			return
+
+		self.counters[name][-1] = int(value)
+
+
+	def get_report(self):
+		""" Dictionary with totals and statistics of each phase and counter, and per-step values """
+
+		nb_steps = len(self.step_time)
+		times = {phase: np.array(self.times[phase]) for phase in loop_phases}
+		counters = {name: np.array(self.counters[name], dtype=np.int64) for name in loop_counters}
+
+		total_time = float(sum(np.sum(times[phase]) for phase in loop_phases))
+		agent_steps = int(np.sum(counters["nb_particles"]))
+
+		report = {"nb_steps": nb_steps,
+					"total_time": total_time,
+					"agent_steps": agent_steps,
+					"agent_steps_per_second": agent_steps/total_time if total_time>0.0 else 0.0,
+					"phases": {}, "counters": {},
+					"per_step": {"time": list(self.step_time)}}
+
+		for phase in loop_phases:
+			t = times[phase]
+			report["phases"][phase] = {"total": float(np.sum(t)),
+										"mean": float(np.mean(t)) if nb_steps>0 else 0.0,
+										"max": float(np.max(t)) if nb_steps>0 else 0.0,
+										"fraction": float(np.sum(t))/total_time if total_time>0.0 else 0.0}
+			report["per_step"][phase] = t.tolist()
+
+		for name in loop_counters:
+			c = counters[name]
+			report["counters"][name] = {"total": int(np.sum(c)),
+										"mean": float(np.mean(c)) if nb_steps>0 else 0.0,
+										"max": int(np.max(c)) if nb_steps>0 else 0}
+			report["per_step"][name] = c.tolist()
+
+		return report
+
+
+	def write_report(self, filename):
+		""" Report written as JSON (nothing is written when disabled) """
+
+		if not self.enabled:
+			return
+
+		with open(filename, "w") as f:
+			json.dump(self.get_report(), f, indent=1)
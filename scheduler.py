@@ -0,0 +1,42 @@
+import heapq
+
+import numpy as np
+
+
+# Kinds of disease state transitions
+SYMPTOMS_ONSET = 0
+RECOVERY = 1
+DEATH = 2
+
+
+class event_scheduler(object):
+	""" Priority queue (heap) of disease state transitions
+
+	 Events (time, kind, part_id) are added when their time is sampled,
+	 so that each step only pops the events that are due. """
+
+	def __init__(self):
+		self.heap = []
+
+
+	def __len__(self):
+		return len(self.heap)
+
+
+	def push(self, times, kind, part_ids):
+		""" Add transitions of given kind for particles part_ids at given times """
+		for time, part_id in zip(np.asarray(times).tolist(), np.asarray(part_ids).tolist()):
+			heapq.heappush(self.heap, (time, kind, part_id))
+
+
+	def pop_due(self, time):
+		""" Remove and return (kinds, part_ids) of all events with a time lower or equal to time """
+
+		kinds = []
+		part_ids = []
+		while len(self.heap)>0 and self.heap[0][0] <= time:
+			event_time, kind, part_id = heapq.heappop(self.heap)
+			kinds.append(kind)
+			part_ids.append(part_id)
+
+		return np.array(kinds, dtype=int), np.array(part_ids, dtype=int)
@@ -0,0 +1,168 @@
+import os
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class shared_memory_store(object):
+	""" Arrays allocated in multiprocessing.shared_memory blocks
+
+	 The small descriptor returned by get_descriptor (names of blocks, shapes and types)
+	 is enough for any other process to attach read-only views with attach_state, without
+	 copying the arrays. A header block holds the current number of particles.
+	 This process alone removes the blocks (release): they are not left to resource trackers. """
+
+	def __init__(self):
+
+		self.blocks = {}
+		self.descriptor = {"arrays": {}}
+		self.released = False
+
+		header = create_block(np.dtype(np.int64).itemsize)
+		self.blocks["header"] = header
+		self.header = np.ndarray((1,), dtype=np.int64, buffer=header.buf)
+		self.header[0] = 0
+		self.descriptor["header"] = header.name
+
+
+	def allocate(self, name, shape, dtype):
+		""" New array in its own block """
+
+		nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+		block = create_block(max(1, nbytes))
+		self.blocks[name] = block
+		self.descriptor["arrays"][name] = (block.name, tuple(shape), np.dtype(dtype).str)
+
+		return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+	def set_nb_particles(self, nb_particles):
+		self.header[0] = nb_particles
+
+
+	def get_descriptor(self):
+		return {"header": self.descriptor["header"], "arrays": dict(self.descriptor["arrays"])}
+
+
+	def release(self):
+		""" Remove the blocks from the system and unmap them from this process
+
+		 Arrays returned by allocate must not be used anymore (copy them before). """
+
+		if self.released:
+			return
+		self.header = None
+		for block in self.blocks.values():
+			unlink_block(block)
+			try:
+				block.close()
+			except BufferError:
+				pass  # An array still uses the block: it is unmapped when the array is freed
+		self.blocks = {}
+		self.released = True
+
+
+
+class shared_state_reader(object):
+	""" Read-only views on the arrays of a shared_memory_store of another process
+
+	 get(name) returns the rows of current particles (the whole array for index_of_id).
+	 Arrays are read while the simulation goes on: copy them for a consistent step.
+	 Attaching works the same way in processes started by the owner with multiprocessing and in
+	 unrelated processes; the blocks stay valid until close, even once the owner released them. """
+
+	def __init__(self, descriptor):
+
+		self.blocks = []
+
+		header = attach_block(descriptor["header"])
+		self.blocks.append(header)
+		self.header = np.ndarray((1,), dtype=np.int64, buffer=header.buf)
+
+		self.arrays = {}
+		for name, (block_name, shape, dtype) in descriptor["arrays"].items():
+			block = attach_block(block_name)
+			self.blocks.append(block)
+			array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+			array.flags.writeable = False
+			self.arrays[name] = array
+
+
+	@property
+	def nb_particles(self):
+		return int(self.header[0])
+
+
+	def get(self, name):
+		if name=="index_of_id":
+			return self.arrays[name]
+		return self.arrays[name][:self.nb_particles]
+
+
+	def close(self):
+		self.header = None
+		self.arrays = {}
+		for block in self.blocks:
+			block.close()
+		self.blocks = []
+
+
+
+#---------------------------------
+# BLOCKS WITHOUT RESOURCE TRACKER
+#---------------------------------
+
+# Before Python 3.13, creating or attaching a block always registers it to the resource tracker of
+# the process, which unlinks it when the process exits (even if the block belongs to another process).
+# A tracker can be shared by several processes (the ones started with multiprocessing share the tracker
+# of their parent), so blocks are unregistered right away: the tracker state never depends on who attached.
+
+tracker_registers_blocks = sys.version_info < (3, 13) and os.name=="posix"
+
+
+def create_block(size):
+
+	if sys.version_info >= (3, 13):
+		return shared_memory.SharedMemory(create=True, size=size, track=False)
+
+	block = shared_memory.SharedMemory(create=True, size=size)
+	untrack_block(block)
+	return block
+
+
+def attach_block(name):
+
+	if sys.version_info >= (3, 13):
+		return shared_memory.SharedMemory(name=name, track=False)
+
+	block = shared_memory.SharedMemory(name=name)
+	untrack_block(block)
+	return block
+
+
+def unlink_block(block):
+
+	# Before Python 3.13, unlink also unregisters the block: it is registered again to keep the tracker balanced
+	if tracker_registers_blocks:
+		from multiprocessing import resource_tracker
+		resource_tracker.register(tracker_name(block), "shared_memory")
+	block.unlink()
+
+
+def untrack_block(block):
+	if tracker_registers_blocks:
+		from multiprocessing import resource_tracker
+		resource_tracker.unregister(tracker_name(block), "shared_memory")
+
+
+
+def tracker_name(block):
+	""" Name registered by SharedMemory (POSIX names start with a slash) """
+	return "/" + block.name
+
+
+
+def attach_state(descriptor):
+	""" Read-only access to the state of a population (see particles_cloud.get_shared_descriptor), Python >= 3.8 """
+	return shared_state_reader(descriptor)
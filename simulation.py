@@ -0,0 +1,211 @@
+import os
+import shutil
+
+import utils
+import checkpoint
+from profiling import loop_profiler
+from domain_decomposition import domain_decomposition
+from time_series import load_time_series
+from particles_cloud import particles_cloud
+
+
+#---------------------------------
+# INITIALIZATION
+#---------------------------------
+
+def initialize_population(input_data):
+	""" Clean the solution folder and build the initial population """
+
+	# Clean previous computation and initialize solution folder
+	utils.clean_init_directory(input_data)
+
+	# Export input parameters to keep track of it in results
+	input_data.export_input()
+
+	# Initialize population
+	population = particles_cloud(input_data)
+
+	# Preventive confinement of part of the population
+	population.set_preventive_confinement(input_data)
+
+	# Preventive vaccination campaign
+	population.perform_vaccination_campaign(input_data)
+
+	return population
+
+
+
+def resume_population(input_data):
+	""" Population and loop counters restored from checkpoint input_data.restart_from
+
+	 Outputs written after the checkpoint are discarded (including later checkpoints). If saving_folder
+	 is not the folder of the checkpoint, outputs written before the checkpoint are copied into it:
+	 this starts a new scenario (with its own parameters) from the shared checkpoint. """
+
+	checkpoint_folder = os.path.dirname(os.path.abspath(input_data.restart_from))
+
+	if checkpoint_folder != os.path.abspath(input_data.saving_folder):
+		if os.path.exists(input_data.saving_folder):
+			shutil.rmtree(input_data.saving_folder)
+		shutil.copytree(checkpoint_folder, input_data.saving_folder,
+						ignore=shutil.ignore_patterns("checkpoint*.h5*", "images"))
+
+	# Images are rendered again from snapshots
+	shutil.rmtree(input_data.saving_folder + "/images", ignore_errors=True)
+	os.makedirs(input_data.saving_folder + "/images")
+
+	input_data.export_input()
+
+	state, counters = checkpoint.load_checkpoint(input_data.restart_from)
+	population = particles_cloud(input_data, state)
+
+	checkpoint.remove_checkpoints(input_data.saving_folder, after=counters["nb_timestep"])
+
+	return population, counters
+
+
+#---------------------------------
+# TIME-STEPPING
+#---------------------------------
+
+def run_time_loop(population, input_data, verbose=True, on_snapshot=None, counters=None):
+	""" Advance population until no one is infected anymore (or t_max is reached)
+
+	 If given, on_snapshot is called with population.get_snapshot() each time a snapshot is saved.
+	 The loop starts from given counters (time, nb_timestep, nb_saved_sol) when resuming a run.
+	 A checkpoint named by time step is written every checkpoint_frequency days (if set).
+	 If input_data.nb_domain_workers is set, move, walls and contacts run in worker processes
+	 (see domain_decomposition.py). If input_data.profiling is set, the wall time of each phase and per-step counters
+	 are written in profile.json at the end of the run.
+
+	 Returns the final time and the per-step time series of the run (see time_series.py):
+	 time, number of persons in each state (healthy, infected without/with symptoms,
+	 recovered, dead), new infections, deaths and R factor. """
+
+	# Initial time
+	time = 0.0
+	nb_timestep = 0
+
+	# Numerotation of saved solution
+	nb_saved_sol = 0
+
+	if counters is not None:
+		time, nb_timestep, nb_saved_sol = counters["time"], counters["nb_timestep"], counters["nb_saved_sol"]
+
+	# Infected population or not (initially yes)
+	population_is_infected = population.check_if_infected()
+
+	# Number of time steps between checkpoints
+	checkpoint_steps = None
+	if input_data.checkpoint_frequency is not None:
+		checkpoint_steps = max(1, int(round(input_data.checkpoint_frequency/input_data.dt)))
+
+	# Timing of each phase of the loop
+	profiler = loop_profiler(input_data.profiling)
+
+	# Parallel engine: strips of the domain owned by worker processes
+	engine = None
+	try:
+		if input_data.nb_domain_workers is not None:
+			engine = domain_decomposition(population, input_data)
+
+		# Main loop: we stop when there is no one infected anymore
+		while(population_is_infected and time < input_data.t_max):
+
+			if verbose:
+				print(f">> Updating simulation at time t={time} days")
+				print(f"      >>  Size of population: {population.Nb_particles}")
+				print(f"      >>  Effective reproduction rate: {population.R_factor:.2f}")
+				print(f"      >>  Deaths: {population.state_counts[4]}\n")
+
+			profiler.start_step(time)
+			profiler.count("nb_particles", population.Nb_particles)
+
+			if engine is None:
+
+				# Move particles
+				population.move(input_data.dt)
+				profiler.lap("move")
+
+				# Resolve wall collisions
+				population.resolve_wall_collisions()
+				profiler.lap("wall_collisions")
+
+				# Resolve inter-particles collisions (including spreading the disease)
+				population.resolve_particle_collisions(time, input_data)
+				profiler.lap("particle_collisions")
+
+			else:
+				# Same steps in workers, infections on population
+				engine.advance(time, input_data)
+				profiler.lap("domain_advance")
+
+			profiler.count("contact_pairs", population.nb_contacts)
+
+			# Resolve change of state
+			population.change_person_state(time, input_data)
+			profiler.lap("change_person_state")
+			profiler.count("transitions", population.nb_transitions)
+
+			# Remove deads
+			population.remove_deads()
+			if engine is not None:
+				engine.synchronize()
+			profiler.lap("remove_deads")
+
+			# Compute R factor for current population
+			population.compute_R_factor(time, input_data)
+			profiler.lap("compute_R_factor")
+
+			# Save state in h5 file
+			if input_data.save_snapshots and abs(time-nb_saved_sol*input_data.saving_frequency)<0.9*input_data.dt:
+				if engine is not None:
+					engine.gather()
+				population.export_state_to_file(time, nb_saved_sol, input_data.saving_folder)
+				nb_saved_sol += 1
+				if on_snapshot is not None:
+					on_snapshot(population.get_snapshot(time))
+			profiler.lap("export")
+
+			# Recording time series
+			profiler.count("infections", population.nb_new_infections)
+			population.record_time_series(time, nb_timestep)
+			profiler.lap("time_series")
+
+			# Check if there is still someone infected
+			population_is_infected = population.check_if_infected()
+			profiler.lap("check_if_infected")
+
+			# time update
+			time += input_data.dt
+			nb_timestep += 1
+
+			# Full state of the run (loop restarts here when resuming)
+			if checkpoint_steps is not None and nb_timestep%checkpoint_steps==0:
+				if engine is not None:
+					engine.gather()
+				checkpoint.save_checkpoint(checkpoint.checkpoint_filename(input_data.saving_folder, nb_timestep), population,
+											{"time": time, "nb_timestep": nb_timestep, "nb_saved_sol": nb_saved_sol})
+				checkpoint.remove_checkpoints(input_data.saving_folder, keep_last=input_data.nb_checkpoints_kept)
+			profiler.lap("checkpoint")
+
+		# Final positions and velocities
+		if engine is not None:
+			engine.gather()
+
+		# Write remaining buffered outputs
+		population.close_outputs()
+
+	finally:
+		# Workers are stopped and shared blocks removed, even if the loop failed
+		if engine is not None:
+			engine.close()
+
+		# Other processes cannot attach to the state anymore
+		population.release_shared_memory()
+
+	profiler.write_report(input_data.saving_folder + "/profile.json")
+
+	time_end = time - input_data.dt  # We remove one dt else we have a small shift on plot
+
+	return time_end, load_time_series(input_data.saving_folder)
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# Headless: no display needed
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+# Modules of the simulation are at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def small_input(tmp_path):
+	""" Factory of checked input data for small seeded runs in tmp_path (parameters override defaults) """
+
+	from input import input_data
+
+	def make(name="run", **parameters):
+		data = input_data("covid19")
+		data.population_size = 1500
+		data.radius = 0.01
+		data.t_max = 6.0
+		data.seed = 3
+		data.saving_folder = str(tmp_path / name)
+		data.saving_frequency = 1.0
+		data.video_mode = "none"
+		data.profiling = False
+		for parameter, value in parameters.items():
+			setattr(data, parameter, value)
+		data.check_inputs()
+		return data
+
+	return make
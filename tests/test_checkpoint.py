@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+
+import simulation
+import checkpoint
+from time_series import load_time_series
+from trajectory import trajectory_reader
+from event_log import load_disease_times
+
+
+def run(data, population=None, counters=None):
+	if population is None:
+		population = simulation.initialize_population(data)
+	simulation.run_time_loop(population, data, verbose=False, counters=counters)
+
+
+def resume(data):
+	population, counters = simulation.resume_population(data)
+	run(data, population, counters)
+	return counters
+
+
+def last_snapshot(folder):
+	trajectory = trajectory_reader(folder + "/trajectory.h5")
+	snapshot = trajectory.read_snapshot(trajectory.nb_snapshots-1)
+	snapshot["nb_snapshots"] = trajectory.nb_snapshots
+	trajectory.close()
+	return snapshot
+
+
+def assert_same_run(folder, reference_folder):
+	""" Same time series, disease times and last snapshot """
+
+	series = load_time_series(folder)
+	reference = load_time_series(reference_folder)
+	for name in reference:
+		np.testing.assert_array_equal(series[name], reference[name])
+
+	times = load_disease_times(folder)
+	reference_times = load_disease_times(reference_folder)
+	for kind in reference_times:
+		np.testing.assert_array_equal(times[kind], reference_times[kind])
+
+	snapshot = last_snapshot(folder)
+	reference_snapshot = last_snapshot(reference_folder)
+	for name in reference_snapshot:
+		np.testing.assert_array_equal(snapshot[name], reference_snapshot[name])
+
+
+def test_checkpoints_named_by_step(small_input):
+
+	data = small_input(checkpoint_frequency=1.0)
+	run(data)
+
+	steps = [step for step, filename in checkpoint.list_checkpoints(data.saving_folder)]
+	assert steps==[20, 40, 60, 80, 100, 120]
+
+	state, counters = checkpoint.load_checkpoint(checkpoint.checkpoint_filename(data.saving_folder, 60))
+	assert counters["nb_timestep"]==60 and abs(counters["time"]-3.0) < 1e-9
+
+
+def test_last_checkpoints_kept(small_input):
+
+	data = small_input(checkpoint_frequency=1.0, nb_checkpoints_kept=2)
+	run(data)
+
+	assert [step for step, filename in checkpoint.list_checkpoints(data.saving_folder)]==[100, 120]
+	assert not any(name.endswith(".tmp") for name in os.listdir(data.saving_folder))
+
+
+def test_resumed_run_matches_uninterrupted_run(small_input):
+
+	reference = small_input("reference")
+	run(reference)
+
+	# Run interrupted at half time (last checkpoint at t_max), then resumed in the same folder up to t_max
+	interrupted = small_input("resumed", t_max=3.0, checkpoint_frequency=1.0)
+	run(interrupted)
+
+	resumed = small_input("resumed", restart_from=checkpoint.checkpoint_filename(interrupted.saving_folder, 60))
+	counters = resume(resumed)
+	assert counters["nb_timestep"]==60
+
+	assert_same_run(resumed.saving_folder, reference.saving_folder)
+
+
+def test_branches_from_one_checkpoint(small_input):
+
+	reference = small_input("reference", checkpoint_frequency=1.0)
+	run(reference)
+	restart_from = checkpoint.checkpoint_filename(reference.saving_folder, 40)
+
+	# Same parameters: the branch is the end of the reference run
+	branch = small_input("branch", restart_from=restart_from)
+	resume(branch)
+	assert_same_run(branch.saving_folder, reference.saving_folder)
+
+	# Another scenario from the same checkpoint
+	scenario = small_input("scenario", restart_from=restart_from, infection_contact_prob=0.0)
+	resume(scenario)
+	series = load_time_series(scenario.saving_folder)
+	reference_series = load_time_series(reference.saving_folder)
+	np.testing.assert_array_equal(series["counts"][:40], reference_series["counts"][:40])
+	assert np.all(series["new_infections"][40:]==0)
+
+	# The reference run is left unchanged
+	assert [step for step, filename in checkpoint.list_checkpoints(reference.saving_folder)][-1]==120
+
+
+def test_resume_discards_later_checkpoints(small_input):
+
+	data = small_input(checkpoint_frequency=1.0)
+	run(data)
+
+	# Resumed without checkpoints: later checkpoints are not the ones of the new run
+	resumed = small_input(t_max=3.0, restart_from=checkpoint.checkpoint_filename(data.saving_folder, 40))
+	resume(resumed)
+
+	assert [step for step, filename in checkpoint.list_checkpoints(data.saving_folder)]==[20, 40]
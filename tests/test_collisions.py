@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+import collisions
+
+
+def random_configuration(rng, nb_particles, domain_size, radius):
+	""" Uniform positions, some of them just outside the domain (as after a move) """
+	position = rng.uniform(0.0, 1.0, (nb_particles, 2)) * domain_size
+	outside = rng.random(nb_particles) < 0.1
+	position[outside] += rng.uniform(-2.0*radius, 2.0*radius, (np.sum(outside), 2))
+	return position
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("backend", ["cell_list", "kdtree"])
+def test_backends_find_same_contacts(seed, backend):
+
+	rng = np.random.default_rng(seed)
+	radius = rng.uniform(0.005, 0.05)
+	domain_size = np.array((rng.uniform(0.3, 2.0), rng.uniform(0.3, 2.0)))
+	position = random_configuration(rng, rng.integers(2, 800), domain_size, radius)
+
+	reference = collisions.find_contacts(position, radius, domain_size, "dense")
+	contacts = collisions.find_contacts(position, radius, domain_size, backend)
+
+	assert len(reference[0]) > 0
+	for expected, found in zip(reference, contacts):
+		np.testing.assert_array_equal(found, expected)
+
+
+@pytest.mark.parametrize("backend", collisions.collision_backends)
+def test_backends_without_contacts(backend):
+
+	for nb_particles in (0, 1):
+		position = np.full((nb_particles, 2), 0.5)
+		i, j, unit, norm = collisions.find_contacts(position, 0.01, (1.0, 1.0), backend)
+		assert len(i)==len(j)==len(unit)==len(norm)==0
+
+
+def test_cell_list_in_sparse_domain():
+	""" Grid of about 10^10 cells: only occupied cells are stored """
+
+	rng = np.random.default_rng(1)
+	radius = 0.002
+	domain_size = np.array((400.0, 400.0))
+
+	# Clusters of particles far from each other
+	centers = rng.uniform(0.0, 1.0, (20, 2)) * domain_size
+	position = np.repeat(centers, 30, axis=0) + rng.normal(0.0, 2.0*radius, (600, 2))
+
+	reference = collisions.find_contacts(position, radius, domain_size, "dense")
+	contacts = collisions.find_contacts(position, radius, domain_size, "cell_list")
+
+	assert len(reference[0]) > 0
+	for expected, found in zip(reference, contacts):
+		np.testing.assert_array_equal(found, expected)
+
+
+def test_cell_list_with_origin():
+	""" Grid covering a box shifted from the origin (strip of a domain decomposition) """
+
+	rng = np.random.default_rng(2)
+	radius = 0.02
+	origin = (3.0, -1.0)
+	box_size = (0.5, 2.0)
+	position = rng.uniform(0.0, 1.0, (400, 2)) * box_size + origin
+
+	reference = collisions.find_contacts(position, radius, box_size, "dense")
+	contacts = collisions.find_contacts(position, radius, box_size, "cell_list", origin)
+
+	assert len(reference[0]) > 0
+	for expected, found in zip(reference, contacts):
+		np.testing.assert_array_equal(found, expected)
+
+
+def test_resolve_contacts_matches_sequential_loop():
+
+	rng = np.random.default_rng(0)
+	radius = 0.03
+	domain_size = np.array((1.0, 1.0))
+	position = random_configuration(rng, 500, domain_size, radius)
+	velocity = rng.normal(0.0, 1.0, (500, 2))
+
+	i, j, unit, norm = collisions.find_contacts(position, radius, domain_size, "cell_list")
+
+	# Contacts processed one by one, in their (i, j) order
+	expected_position = position.copy()
+	expected_velocity = velocity.copy()
+	for k in range(len(i)):
+		u = unit[k]
+		expected_velocity[i[k]] -= 2.0 * np.dot(u, expected_velocity[i[k]]) * u
+		expected_velocity[j[k]] -= 2.0 * np.dot(u, expected_velocity[j[k]]) * u
+		expected_position[j[k]] += (2.0 * radius - norm[k]) * u
+
+	collisions.resolve_contacts(position, velocity, radius, i, j, unit, norm)
+
+	# Particles in several contacts are pushed by each of them
+	assert len(np.unique(j)) < len(j)
+	np.testing.assert_allclose(velocity, expected_velocity, rtol=0.0, atol=1e-12)
+	np.testing.assert_allclose(position, expected_position, rtol=0.0, atol=1e-12)
@@ -0,0 +1,44 @@
+import numpy as np
+
+import simulation
+from particles_cloud import particles_cloud
+from time_series import load_time_series
+from trajectory import trajectory_reader
+
+
+def bytes_per_particle(columns):
+	return sum(int(np.prod(shape))*np.dtype(dtype).itemsize for shape, dtype, value in columns.values())
+
+
+def test_memory_of_compact_state(small_input):
+
+	assert bytes_per_particle(particles_cloud.columns)==89
+	assert bytes_per_particle(particles_cloud.compact_columns)==42
+
+	# Columns and index of ids
+	standard = simulation.initialize_population(small_input("standard"))
+	compact = simulation.initialize_population(small_input("compact", compact_state=True))
+	assert standard.get_memory_size()==97*standard.population_size
+	assert compact.get_memory_size()<=46*compact.population_size
+	assert compact.position.dtype==np.float32 and compact.state.dtype==np.int8
+
+	standard.close_outputs()
+	compact.close_outputs()
+
+
+def test_compact_run(small_input):
+
+	data = small_input(compact_state=True, t_max=10.0)
+	population = simulation.initialize_population(data)
+	simulation.run_time_loop(population, data, verbose=False)
+
+	# Consistent counts and reduced-precision outputs
+	series = load_time_series(data.saving_folder)
+	assert np.sum(series["new_infections"]) > 0
+	np.testing.assert_array_equal(series["counts"][-1, :4], np.bincount(population.state, minlength=5)[:4])
+
+	trajectory = trajectory_reader(data.saving_folder + "/trajectory.h5")
+	snapshot = trajectory.read_snapshot(trajectory.nb_snapshots-1)
+	assert snapshot["X"].dtype==np.float32 and snapshot["STATE"].dtype==np.int8
+	assert np.all((snapshot["X"] > -data.radius) & (snapshot["X"] < data.L_X + data.radius))
+	trajectory.close()
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+import simulation
+from time_series import load_time_series
+from trajectory import trajectory_reader
+
+
+def run(data):
+	""" Time series and all snapshots of a run """
+
+	population = simulation.initialize_population(data)
+	simulation.run_time_loop(population, data, verbose=False)
+
+	trajectory = trajectory_reader(data.saving_folder + "/trajectory.h5")
+	snapshots = [trajectory.read_snapshot(k) for k in range(trajectory.nb_snapshots)]
+	trajectory.close()
+
+	return load_time_series(data.saving_folder), snapshots
+
+
+@pytest.mark.parametrize("nb_domain_workers", [1, 2, 3])
+def test_domain_decomposition_matches_serial_run(small_input, nb_domain_workers):
+
+	series, snapshots = run(small_input("serial", mortality_rate=0.5))
+	parallel_series, parallel_snapshots = run(small_input("parallel", mortality_rate=0.5,
+															nb_domain_workers=nb_domain_workers))
+
+	assert np.sum(series["new_infections"]) > 0
+	for name in series:
+		np.testing.assert_array_equal(parallel_series[name], series[name])
+
+	# Positions, velocities and states of every snapshot (particles move between strips)
+	assert len(parallel_snapshots)==len(snapshots)
+	for parallel_snapshot, snapshot in zip(parallel_snapshots, snapshots):
+		for name in snapshot:
+			np.testing.assert_array_equal(parallel_snapshot[name], snapshot[name])
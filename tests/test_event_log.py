@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from event_log import event_log, event_kinds, log_formats, load_disease_times
+
+
+@pytest.mark.parametrize("log_format", log_formats)
+def test_event_log_round_trip(tmp_path, log_format):
+
+	rng = np.random.default_rng(0)
+	log = event_log(str(tmp_path), log_format, buffer_size=50)
+
+	# Records of various sizes: some of them trigger a flush
+	expected = {kind: [] for kind in event_kinds}
+	for k in range(40):
+		kind = event_kinds[k % len(event_kinds)]
+		times = rng.uniform(0.0, 30.0, rng.integers(0, 12))
+		log.record(kind, times)
+		expected[kind].append(times)
+	log.flush()
+	assert log.nb_buffered==0
+
+	times = load_disease_times(str(tmp_path), log_format)
+	for kind in event_kinds:
+		np.testing.assert_array_equal(times[kind], np.concatenate(expected[kind]))
+
+
+def test_event_log_writes_only_when_flushed(tmp_path):
+
+	log = event_log(str(tmp_path), "hdf5", buffer_size=100)
+	log.record("incubation", np.ones(10))
+	assert len(load_disease_times(str(tmp_path))["incubation"])==0
+
+	log.flush()
+	assert len(load_disease_times(str(tmp_path))["incubation"])==10
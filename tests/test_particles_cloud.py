@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+import simulation
+from particle import particle, VACCINATED
+
+
+def population_with_states(data, states):
+	""" Population whose first particles have given states (the others are healthy) """
+
+	population = simulation.initialize_population(data)
+	population.state[:] = 0
+	population.state[:len(states)] = states
+	population.state_counts[:] = np.bincount(population.state, minlength=5)
+	return population
+
+
+def test_transmission_of_all_contacts(small_input):
+
+	data = small_input(infection_contact_prob=1.0)
+
+	# 0 and 8 have symptoms, 6 is vaccinated, 7 has recovered
+	population = population_with_states(data, [2, 0, 0, 0, 0, 0, 0, 3, 2])
+	population.set_flag(np.array([6]), VACCINATED)
+
+	contact_i = np.array([0, 0, 3, 4, 0, 0, 1])
+	contact_j = np.array([1, 2, 0, 5, 6, 7, 8])
+	population.transmit_infection(contact_i, contact_j, 1.5, data)
+
+	# Contacts of symptomatics in both directions, each target infected once (by its first contact)
+	np.testing.assert_array_equal(population.state[:9], [2, 1, 1, 1, 0, 0, 0, 3, 2])
+	np.testing.assert_array_equal(population.infection_time[1:4], 1.5)
+	assert np.all(np.isfinite(population.incubation_period[1:4]))
+	np.testing.assert_array_equal(population.nb_infections_provoked[:9], [3, 0, 0, 0, 0, 0, 0, 0, 0])
+	np.testing.assert_array_equal(population.state_counts, np.bincount(population.state, minlength=5))
+	assert population.nb_new_infections==3
+
+	population.close_outputs()
+
+
+def test_transmission_probability(small_input):
+
+	data = small_input(infection_contact_prob=0.3)
+	population = population_with_states(data, [2])
+
+	# One symptomatic in contact with all the others
+	contact_j = np.arange(1, data.population_size)
+	population.transmit_infection(np.zeros(len(contact_j), dtype=int), contact_j, 0.0, data)
+
+	nb_infected = np.sum(population.state==1)
+	expected = 0.3*len(contact_j)
+	assert abs(nb_infected - expected) < 4.0*np.sqrt(expected)
+	assert population.nb_infections_provoked[0]==nb_infected
+
+	population.close_outputs()
+
+
+def brute_force_R_factor(population, time, data):
+	""" R estimator by a loop on persons with symptoms """
+
+	mean_infection_duration = (data.mortality_rate*data.mean_onset_to_death
+								+ (1.0-data.mortality_rate)*data.mean_onset_to_recov)
+	total = 0.0
+	symptomatics = np.nonzero(population.state==2)[0]
+	for k in symptomatics:
+		infected_since = time - population.infection_time[k]
+		if infected_since!=0.0:
+			total += mean_infection_duration*population.nb_infections_provoked[k]/infected_since
+
+	return total/len(symptomatics) if len(symptomatics)>0 else 0.0
+
+
+def test_running_counters_match_states(small_input):
+
+	data = small_input(t_max=25.0, saving_frequency=0.05, mortality_rate=0.5)
+	population = simulation.initialize_population(data)
+
+	# Checked at every step
+	checked = []
+	def check(snapshot):
+		counts = np.bincount(population.state, minlength=5)
+		np.testing.assert_array_equal(population.state_counts[:4], counts[:4])
+		assert population.state_counts[4]==data.population_size - population.Nb_particles
+		assert population.check_if_infected()==(counts[1] + counts[2] > 0)
+		assert population.R_factor==pytest.approx(brute_force_R_factor(population, snapshot["TIME"], data), rel=1e-9)
+		checked.append(snapshot["TIME"])
+
+	simulation.run_time_loop(population, data, verbose=False, on_snapshot=check)
+
+	assert len(checked) > 100
+	assert population.state_counts[4] > 0
+
+
+def test_remove_deads_keeps_order_and_ids(small_input):
+
+	data = small_input()
+	population = simulation.initialize_population(data)
+	position = population.position.copy()
+
+	dead_ids = np.array([0, 10, 11, 700, data.population_size-1])
+	population.state[dead_ids] = 4
+	population.state_counts[:] = np.bincount(population.state, minlength=5)
+	population.remove_deads()
+
+	# Remaining particles keep their order and data, views follow their id
+	alive_ids = np.setdiff1d(np.arange(data.population_size), dead_ids)
+	np.testing.assert_array_equal(population.part_id, alive_ids)
+	np.testing.assert_array_equal(population.position, position[alive_ids])
+	np.testing.assert_array_equal(population.get_indices(alive_ids), np.arange(len(alive_ids)))
+	view = particle(population, 12)
+	assert view.index==9 and view.x==position[12, 0]
+
+	# Removed particles cannot be accessed
+	with pytest.raises(LookupError):
+		population.get_indices(np.array([5, 10]))
+	with pytest.raises(LookupError):
+		particle(population, 11).state = 1
+	assert population.state[-1]==0
+
+	population.close_outputs()
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import simulation
+from profiling import loop_phases, loop_profiler
+
+
+def run_report(data):
+	population = simulation.initialize_population(data)
+	simulation.run_time_loop(population, data, verbose=False)
+	with open(data.saving_folder + "/profile.json") as f:
+		return json.load(f)
+
+
+def test_profiler_phases():
+
+	profiler = loop_profiler()
+	for step in range(3):
+		profiler.start_step(0.1*step)
+		profiler.lap("move")
+		profiler.lap("export")
+		profiler.count("nb_particles", 10)
+
+	report = profiler.get_report()
+	assert report["nb_steps"]==3 and report["agent_steps"]==30
+	assert report["per_step"]["time"]==pytest.approx([0.0, 0.1, 0.2])
+	assert report["per_step"]["checkpoint"]==[0.0, 0.0, 0.0]
+	assert report["total_time"]==pytest.approx(sum(report["phases"][phase]["total"] for phase in loop_phases))
+
+
+@pytest.mark.parametrize("nb_domain_workers", [None, 2])
+def test_profile_of_run(small_input, nb_domain_workers):
+
+	data = small_input(profiling=True, nb_domain_workers=nb_domain_workers)
+	report = run_report(data)
+	phases = report["phases"]
+
+	assert report["nb_steps"]==len(report["per_step"]["time"]) > 0
+	assert report["counters"]["contact_pairs"]["total"] > 0
+
+	# Steps run by workers are timed as a whole, serial steps phase by phase
+	serial_phases = ("move", "wall_collisions", "particle_collisions")
+	if nb_domain_workers is None:
+		assert all(phases[phase]["total"] > 0.0 for phase in serial_phases)
+		assert phases["domain_advance"]["total"]==0.0
+	else:
+		assert all(phases[phase]["total"]==0.0 for phase in serial_phases)
+		assert phases["domain_advance"]["total"] > 0.0
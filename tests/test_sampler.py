@@ -0,0 +1,42 @@
+import numpy as np
+
+from input import input_data
+import utils
+
+
+def test_binary_search_matches_linear_scan():
+
+	data = input_data("covid19")
+	sampler = utils.inverse_cdf_sampler(data.incubation_proba)
+
+	y = np.random.default_rng(0).random(200)
+	expected = [utils.invert_cdf(value, data.incubation_proba) for value in y]
+	np.testing.assert_array_equal(sampler.sample(y), expected)
+
+
+def test_quantiles_close_to_exact_inversion():
+
+	data = input_data("covid19")
+	exact = utils.inverse_cdf_sampler(data.onset_to_death_proba)
+	interpolated = utils.inverse_cdf_sampler(data.onset_to_death_proba, 4096)
+
+	# The exact inversion returns the next tabulated point: away from the flat tails of the cdf,
+	# differences are within about one step of the table
+	step = np.max(np.diff(data.onset_to_death_proba[:,0]))
+	y = np.random.default_rng(1).uniform(0.01, 0.99, 100000)
+	assert np.max(np.abs(interpolated.sample(y) - exact.sample(y))) < 1.05*step
+
+	y = np.random.default_rng(2).random(100000)
+	assert abs(np.mean(interpolated.sample(y)) - np.mean(exact.sample(y))) < step
+
+
+def test_samplers_follow_nb_cdf_quantiles():
+
+	data = input_data("covid19")
+	assert data.incubation_sampler.nb_quantiles is None
+
+	# Changed on an existing input_data (as in ensemble and benchmark runs)
+	data.nb_cdf_quantiles = 1000
+	assert data.incubation_sampler.nb_quantiles==1000
+	assert data.onset_to_recov_sampler.nb_quantiles==1000
+	assert data.incubation_sampler is data.incubation_sampler
@@ -0,0 +1,39 @@
+import numpy as np
+
+import scheduler
+from scheduler import event_scheduler
+import simulation
+from particle import WILL_DIE
+
+
+def test_pop_due_events_in_time_order():
+
+	events = event_scheduler()
+	events.push([3.0, 1.0, 2.0], scheduler.RECOVERY, [10, 11, 12])
+	events.push([1.5, 5.0], scheduler.DEATH, [13, 14])
+
+	kinds, part_ids = events.pop_due(2.0)
+	np.testing.assert_array_equal(part_ids, [11, 13, 12])
+	np.testing.assert_array_equal(kinds, [scheduler.RECOVERY, scheduler.DEATH, scheduler.RECOVERY])
+
+	# Events are popped once, later events stay
+	assert len(events.pop_due(2.0)[0])==0
+	np.testing.assert_array_equal(events.pop_due(10.0)[1], [10, 14])
+	assert len(events)==0
+
+
+def test_transitions_happen_when_due(small_input):
+
+	data = small_input(t_max=15.0)
+	population = simulation.initialize_population(data)
+	time_end, series = simulation.run_time_loop(population, data, verbose=False)
+	assert series["counts"][-1, 3] > 0
+
+	onset = population.infection_time + population.incubation_period
+	end = onset + np.where(population.has_flag(slice(None), WILL_DIE), population.death_time, population.recovery_time)
+	state = population.state
+
+	# Each transition happens at the first step after its time
+	assert np.all(onset[state==1] > time_end)
+	assert np.all(onset[state==2] <= time_end) and np.all(end[state==2] > time_end)
+	assert np.all(end[state==3] <= time_end)
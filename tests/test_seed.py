@@ -0,0 +1,46 @@
+import numpy as np
+
+import simulation
+import ensemble
+from time_series import load_time_series, load_seed
+
+
+def run_series(data):
+	population = simulation.initialize_population(data)
+	simulation.run_time_loop(population, data, verbose=False)
+	return load_time_series(data.saving_folder)
+
+
+def same_series(series, other):
+	return all(np.array_equal(series[name], other[name]) for name in series)
+
+
+def test_same_seed_gives_same_run(small_input):
+
+	series = run_series(small_input("first", seed=11))
+	assert np.sum(series["new_infections"]) > 0
+
+	assert same_series(run_series(small_input("second", seed=11)), series)
+	assert not same_series(run_series(small_input("other", seed=12)), series)
+
+
+def test_unseeded_run_can_be_reproduced(small_input):
+
+	data = small_input("unseeded", seed=None)
+	series = run_series(data)
+
+	seed = load_seed(data.saving_folder)
+	assert seed.entropy is not None
+	assert same_series(run_series(small_input("reproduced", seed=seed)), series)
+
+
+def test_ensemble_seeded_from_input_data(small_input):
+
+	statistics = [ensemble.run_ensemble(small_input("ensemble", seed=5, population_size=500), 3, 1)
+					for k in range(2)]
+	np.testing.assert_array_equal(statistics[0]["peak_value"], statistics[1]["peak_value"])
+
+	# Members have independent streams spawned from the seed of the ensemble
+	seeds = [load_seed(small_input("ensemble").saving_folder + "/run_{:04d}".format(k)) for k in range(3)]
+	assert [seed.entropy for seed in seeds]==[5, 5, 5]
+	assert [seed.spawn_key for seed in seeds]==[(0,), (1,), (2,)]
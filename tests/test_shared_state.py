@@ -0,0 +1,87 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+import simulation
+from shared_state import attach_state
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Unrelated process: the descriptor is all it gets
+READER_SCRIPT = """
+import json, sys
+from shared_state import attach_state
+reader = attach_state(json.load(sys.stdin))
+print(json.dumps([reader.nb_particles, reader.get("state").tolist()]))
+reader.close()
+"""
+
+pytestmark = pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="blocks listed in /dev/shm")
+
+
+def read_state(descriptor):
+	""" Number of particles and states seen from another process """
+	reader = attach_state(descriptor)
+	result = (reader.nb_particles, reader.get("state").tolist())
+	reader.close()
+	return result
+
+
+def block_names(descriptor):
+	return [descriptor["header"]] + [block_name for block_name, shape, dtype in descriptor["arrays"].values()]
+
+
+def blocks_exist(descriptor):
+	return [os.path.exists("/dev/shm/" + name) for name in block_names(descriptor)]
+
+
+def test_attach_from_child_and_unrelated_process(small_input):
+
+	data = small_input(shared_memory=True)
+	population = simulation.initialize_population(data)
+	descriptor = population.get_shared_descriptor()
+	expected = (population.Nb_particles, population.state.tolist())
+
+	# Child started by this process with multiprocessing (shares its resource tracker)
+	with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+		assert executor.submit(read_state, descriptor).result() == expected
+
+	# Unrelated process (its own resource tracker)
+	completed = subprocess.run([sys.executable, "-c", READER_SCRIPT], input=json.dumps(descriptor),
+								capture_output=True, text=True, cwd=REPOSITORY, check=True)
+	assert tuple(json.loads(completed.stdout)) == expected
+	assert completed.stderr == ""
+
+	# Readers exiting do not remove the blocks of the owner
+	assert all(blocks_exist(descriptor))
+	assert read_state(descriptor) == expected
+
+	# Owner alone removes them, at the end of the run
+	simulation.run_time_loop(population, data, verbose=False)
+	assert not any(blocks_exist(descriptor))
+
+	# Population stays usable in process memory
+	assert population.shared_memory is None
+	assert len(population.state)==population.Nb_particles
+	np.testing.assert_array_equal(population.index_of_id[population.part_id], np.arange(population.Nb_particles))
+
+
+def test_blocks_removed_when_loop_fails(small_input, monkeypatch):
+
+	data = small_input(shared_memory=True)
+	population = simulation.initialize_population(data)
+	descriptor = population.get_shared_descriptor()
+
+	def fail(*args):
+		raise RuntimeError("failed step")
+	monkeypatch.setattr(population, "change_person_state", fail)
+
+	with pytest.raises(RuntimeError, match="failed step"):
+		simulation.run_time_loop(population, data, verbose=False)
+	assert not any(blocks_exist(descriptor))
@@ -0,0 +1,63 @@
+import numpy as np
+
+from trajectory import trajectory_writer, trajectory_reader, particle_datasets
+
+
+def write_snapshots(filename, nb_snapshots, nb_snapshots_kept=0, chunk_size=64):
+	""" Snapshots of a shrinking population (snapshot k has 100-7k particles), one every 0.5 day """
+
+	writer = trajectory_writer(filename, chunk_size, nb_snapshots_kept)
+	snapshots = []
+	for k in range(nb_snapshots_kept, nb_snapshots):
+		nb_particles = 100 - 7*k
+		data = {"ID": np.arange(nb_particles) + k, "X": np.full(nb_particles, 0.1*k), "Y": np.linspace(0.0, 1.0, nb_particles),
+				"VX": np.zeros(nb_particles), "VY": np.ones(nb_particles), "STATE": np.full(nb_particles, k % 5)}
+		writer.append(0.5*k, 10*k, 0.01*k, np.full(5, k), data)
+		snapshots.append(data)
+	writer.close()
+	return snapshots
+
+
+def test_snapshots_of_shrinking_population(tmp_path):
+
+	filename = str(tmp_path / "trajectory.h5")
+	snapshots = write_snapshots(filename, 8)
+
+	trajectory = trajectory_reader(filename)
+	assert trajectory.nb_snapshots==8
+	for k, data in enumerate(snapshots):
+		snapshot = trajectory.read_snapshot(k)
+		for name in particle_datasets:
+			np.testing.assert_array_equal(snapshot[name], data[name])
+		assert snapshot["TIME"]==0.5*k and snapshot["NB_TIMESTEP"]==10*k
+		np.testing.assert_array_equal(trajectory.counts[k], np.full(5, k))
+	trajectory.close()
+
+
+def test_read_at_time(tmp_path):
+
+	filename = str(tmp_path / "trajectory.h5")
+	write_snapshots(filename, 8)
+
+	trajectory = trajectory_reader(filename)
+
+	# Last snapshot saved at or before given time
+	for time, k in ((0.0, 0), (0.4, 0), (0.5, 1), (1.74, 3), (3.5, 7), (100.0, 7)):
+		snapshot = trajectory.read_at_time(time, ("X",))
+		assert snapshot["TIME"]==0.5*k
+		np.testing.assert_array_equal(snapshot["X"], np.full(100-7*k, 0.1*k))
+	trajectory.close()
+
+
+
+def test_continue_from_first_snapshots(tmp_path):
+
+	filename = str(tmp_path / "trajectory.h5")
+	write_snapshots(filename, 8)
+	snapshots = write_snapshots(filename, 6, nb_snapshots_kept=3)
+
+	trajectory = trajectory_reader(filename)
+	assert trajectory.nb_snapshots==6
+	np.testing.assert_array_equal(trajectory.read_snapshot(5)["ID"], snapshots[-1]["ID"])
+	assert trajectory.offset[5] + trajectory.nb_particles[5]==sum(100-7*k for k in range(6))
+	trajectory.close()
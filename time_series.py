@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+
+import h5py
+
+
+# Per-step datasets: name, shape of one row and type
+series_datasets = {"TIME": ((), float),
+					"NB_TIMESTEP": ((), np.int64),
+					"COUNTS": ((5,), np.int64),
+					"NEW_INFECTIONS": ((), np.int64),
+					"DEATHS": ((), np.int64),
+					"R_FACTOR": ((), float)}
+
+
+class time_series_writer(object):
+	""" Per-step record of the run in a single HDF5 file (time_series.h5)
+
+	 One row per time step: time, step number, number of persons in each state
+	 (healthy, infected without/with symptoms, recovered, dead), number of new
+	 infections during the step, cumulated number of deaths and R factor.
+	 Rows are buffered and appended to extendable datasets every buffer_size steps.
+	 The seed sequence of the run is written in SEED_ENTROPY (as a string) and SPAWN_KEY.
+	 If nb_rows is given, an existing file is continued from its first nb_rows rows. """
+
+	def __init__(self, filename, buffer_size=1000, nb_rows=None, seed_sequence=None):
+
+		self.filename = filename
+		self.buffer_size = buffer_size
+
+		if nb_rows is None:
+			with h5py.File(filename, "w") as hf:
+				for name, (shape, dtype) in series_datasets.items():
+					hf.create_dataset(name, shape=(0,)+shape, maxshape=(None,)+shape, chunks=(1024,)+shape, dtype=dtype)
+				if seed_sequence is not None:
+					hf.create_dataset("SEED_ENTROPY", data=str(seed_sequence.entropy))
+					hf.create_dataset("SPAWN_KEY", data=np.array(seed_sequence.spawn_key, dtype=np.int64))
+			nb_rows = 0
+		else:
+			with h5py.File(filename, "a") as hf:
+				for name, (shape, dtype) in series_datasets.items():
+					hf[name].resize((nb_rows,)+shape)
+
+		# Number of rows written on disk
+		self.nb_rows = nb_rows
+
+		self.buffer = {name: [] for name in series_datasets}
+
+
+	def append(self, time, nb_timestep, counts, new_infections, R_factor):
+
+		row = {"TIME": time, "NB_TIMESTEP": nb_timestep, "COUNTS": np.array(counts),
+				"NEW_INFECTIONS": new_infections, "DEATHS": counts[4], "R_FACTOR": R_factor}
+		for name in series_datasets:
+			self.buffer[name].append(row[name])
+
+		if len(self.buffer["TIME"]) >= self.buffer_size:
+			self.flush()
+
+
+	def flush(self):
+		""" Write buffered rows to disk """
+
+		nb_rows = len(self.buffer["TIME"])
+		if nb_rows==0:
+			return
+
+		with h5py.File(self.filename, "a") as hf:
+			for name, (shape, dtype) in series_datasets.items():
+				dset = hf[name]
+				dset.resize((dset.shape[0] + nb_rows,)+shape)
+				dset[-nb_rows:] = np.array(self.buffer[name], dtype=dtype).reshape((nb_rows,)+shape)
+
+		self.nb_rows += nb_rows
+		self.buffer = {name: [] for name in series_datasets}
+
+
+	def close(self):
+		self.flush()
+
+
+
+def load_time_series(folder):
+	""" Per-step time series written in folder: dictionary with keys time, nb_timestep,
+	 counts, new_infections, deaths and R_factor (empty arrays if nothing was written) """
+
+	series = {name: np.zeros((0,)+shape, dtype=dtype) for name, (shape, dtype) in series_datasets.items()}
+
+	if os.path.exists(folder + "/time_series.h5"):
+		with h5py.File(folder + "/time_series.h5", "r") as hf:
+			for name in series_datasets:
+				series[name] = hf[name][()]
+
+	return {"time": series["TIME"], "nb_timestep": series["NB_TIMESTEP"], "counts": series["COUNTS"],
+			"new_infections": series["NEW_INFECTIONS"], "deaths": series["DEATHS"],
+			"R_factor": series["R_FACTOR"]}
+
+
+
+def load_seed(folder):
+	""" Seed sequence of the run written in folder: setting input_data.seed to it reproduces the run """
+
+	with h5py.File(folder + "/time_series.h5", "r") as hf:
+		entropy = hf["SEED_ENTROPY"][()]
+		spawn_key = tuple(hf["SPAWN_KEY"][()].tolist())
+
+	# Strings are read as bytes with h5py 3
+	if isinstance(entropy, bytes):
+		entropy = entropy.decode()
+
+	return np.random.SeedSequence(int(entropy), spawn_key=spawn_key)
@@ -0,0 +1,140 @@
+import numpy as np
+
+import h5py
+
+
+# Per-particle datasets (concatenated over snapshots)
+particle_datasets = ("ID", "X", "Y", "VX", "VY", "STATE")
+
+
+class trajectory_writer(object):
+	""" Single HDF5 file holding all the snapshots of a run
+
+	 Per-particle datasets (ID, X, Y, VX, VY, STATE) are chunked and resizable:
+	 snapshot k is stored in rows OFFSET[k]:OFFSET[k]+NB_PARTICLES[k], which handles
+	 the shrinking population. Per-snapshot datasets: TIME, NB_TIMESTEP, R_FACTOR and
+	 COUNTS (number of persons in each state).
+	 If nb_snapshots is given, an existing file is continued from its first nb_snapshots snapshots. """
+
+	def __init__(self, filename, chunk_size=16384, nb_snapshots=0):
+
+		self.filename = filename
+		self.chunk_size = chunk_size
+
+		# Number of snapshots and of particle rows written so far
+		self.nb_snapshots = nb_snapshots
+		self.nb_rows = 0
+
+		if nb_snapshots==0:
+			self.hf = h5py.File(filename, "w")
+			return
+
+		# Discarding snapshots written after the first nb_snapshots
+		self.hf = h5py.File(filename, "a")
+		k = nb_snapshots-1
+		self.nb_rows = int(self.hf["OFFSET"][k] + self.hf["NB_PARTICLES"][k])
+		for name in ("TIME", "R_FACTOR", "NB_TIMESTEP", "OFFSET", "NB_PARTICLES"):
+			self.hf[name].resize((nb_snapshots,))
+		self.hf["COUNTS"].resize((nb_snapshots, 5))
+		for name in particle_datasets:
+			self.hf[name].resize((self.nb_rows,))
+
+
+	def create_datasets(self, data):
+		""" Datasets are created at first snapshot, with the types of the data """
+
+		for name in ("TIME", "R_FACTOR"):
+			self.hf.create_dataset(name, shape=(0,), maxshape=(None,), chunks=(256,), dtype=float)
+		for name in ("NB_TIMESTEP", "OFFSET", "NB_PARTICLES"):
+			self.hf.create_dataset(name, shape=(0,), maxshape=(None,), chunks=(256,), dtype=np.int64)
+		self.hf.create_dataset("COUNTS", shape=(0, 5), maxshape=(None, 5), chunks=(256, 5), dtype=np.int64)
+		for name in particle_datasets:
+			self.hf.create_dataset(name, shape=(0,), maxshape=(None,), chunks=(self.chunk_size,),
+									dtype=np.asarray(data[name]).dtype)
+
+
+	def append(self, time, nb_timestep, R_factor, counts, data):
+		""" Append a snapshot: data is a dictionary of per-particle arrays (ID, X, Y, VX, VY, STATE) """
+
+		if self.nb_snapshots==0:
+			self.create_datasets(data)
+
+		nb_particles = len(data["ID"])
+
+		# Per-snapshot values
+		values = {"TIME": time, "NB_TIMESTEP": nb_timestep, "R_FACTOR": R_factor,
+					"OFFSET": self.nb_rows, "NB_PARTICLES": nb_particles}
+		for name in values:
+			self.hf[name].resize((self.nb_snapshots+1,))
+			self.hf[name][self.nb_snapshots] = values[name]
+		self.hf["COUNTS"].resize((self.nb_snapshots+1, 5))
+		self.hf["COUNTS"][self.nb_snapshots] = counts
+
+		# Per-particle values
+		for name in particle_datasets:
+			self.hf[name].resize((self.nb_rows+nb_particles,))
+			self.hf[name][self.nb_rows:] = data[name]
+
+		self.nb_snapshots += 1
+		self.nb_rows += nb_particles
+
+		# Keep file consistent on disk if the run stops
+		self.hf.flush()
+
+
+	def close(self):
+		self.hf.close()
+
+
+
+class trajectory_reader(object):
+	""" Random access to the snapshots of a trajectory file """
+
+	def __init__(self, filename):
+
+		self.hf = h5py.File(filename, "r")
+
+		# Per-snapshot data
+		if "TIME" in self.hf:
+			self.time = self.hf["TIME"][()]
+			self.nb_timestep = self.hf["NB_TIMESTEP"][()]
+			self.R_factor = self.hf["R_FACTOR"][()]
+			self.offset = self.hf["OFFSET"][()]
+			self.nb_particles = self.hf["NB_PARTICLES"][()]
+			self.counts = self.hf["COUNTS"][()]
+		else:  # nothing was saved
+			self.time = np.zeros(0)
+			self.nb_timestep = np.zeros(0, dtype=np.int64)
+			self.R_factor = np.zeros(0)
+			self.offset = np.zeros(0, dtype=np.int64)
+			self.nb_particles = np.zeros(0, dtype=np.int64)
+			self.counts = np.zeros((0, 5), dtype=np.int64)
+
+		self.nb_snapshots = len(self.time)
+
+
+	def read_snapshot(self, k, names=particle_datasets):
+		""" Dictionary with per-particle arrays and per-snapshot values of snapshot k """
+
+		start = self.offset[k]
+		end = start + self.nb_particles[k]
+
+		snapshot = {name: self.hf[name][start:end] for name in names}
+		snapshot["TIME"] = self.time[k]
+		snapshot["NB_TIMESTEP"] = self.nb_timestep[k]
+		snapshot["R_FACTOR"] = self.R_factor[k]
+
+		return snapshot
+
+
+	def find_snapshot(self, time):
+		""" Index of the last snapshot saved at or before time """
+		return max(0, np.searchsorted(self.time, time, side="right")-1)
+
+
+	def read_at_time(self, time, names=particle_datasets):
+		return self.read_snapshot(self.find_snapshot(time), names)
+
+
+	def close(self):
+		self.hf.close()
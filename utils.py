@@ -7,6 +7,8 @@ from scipy.stats import gamma, lognorm, uniform
 
 import matplotlib.pyplot as plt
 
+import event_log
+
 #---------------------------------
 # PARTICLE RELATED FUNCTIONS
 #---------------------------------
@@ -77,7 +79,7 @@ def compute_gamma_cdf(mean_val, std_val, saving_folder):
 
 # For a given y value, invert an abitrary CDF
 def invert_cdf(y, cdf_mat):
-	""" y is a number between 0 and 1
+	""" y is a number (or an array of numbers) between 0 and 1
 	 cdf is a vector representing a CDF (growing function)
 	 (it goes from (val_min,vam_max) to [0,1]) """
 
@@ -85,15 +87,54 @@ def invert_cdf(y, cdf_mat):
 	x = cdf_mat[:,0]
 	cdf = cdf_mat[:,1]
 
-	# By default inverse of y is max(x)
-	inv_y = np.max(x)
+	# First point where cdf>=y (by default inverse of y is max(x))
+	index = np.searchsorted(cdf, y, side="left")
+
+	return np.append(x, np.max(x))[index]
+
+
+
+class inverse_cdf_sampler(object):
+	""" Sampler of durations from a tabulated CDF (built once per law)
+
+	 sample() maps an array of uniforms in [0,1] to an array of durations.
+	 By default the first tabulated point where cdf>=y is returned (same as invert_cdf)
+	 with a binary search. If nb_quantiles is given, durations are linearly interpolated
+	 in a table of quantiles on a uniform grid of [0,1], which is O(1) per query. """
+
+	def __init__(self, cdf_mat, nb_quantiles=None):
+
+		# Unpacking cdf
+		self.x = cdf_mat[:,0]
+		self.cdf = cdf_mat[:,1]
+		self.nb_quantiles = nb_quantiles
+
+		# Values returned by the binary search (by default inverse of y is max(x))
+		self.x_search = np.append(self.x, np.max(self.x))
+
+		if nb_quantiles is not None:
+
+			# Quantiles on a uniform grid: linear interpolation of the cdf between tabulated points
+			y_grid = np.linspace(0.0, 1.0, nb_quantiles)
+			index = np.clip(np.searchsorted(self.cdf, y_grid, side="left"), 1, len(self.cdf)-1)
+			x0, x1 = self.x[index-1], self.x[index]
+			cdf0, cdf1 = self.cdf[index-1], self.cdf[index]
+			with np.errstate(divide="ignore", invalid="ignore"):
+				weight = np.where(cdf1>cdf0, (y_grid-cdf0)/(cdf1-cdf0), 1.0)
+			self.quantiles = np.clip(x0 + np.clip(weight, 0.0, 1.0)*(x1-x0), self.x[0], self.x[-1])
 
-	for i in range(len(cdf)):
-		if cdf[i]>=y:
-			inv_y = x[i]
-			break
 
-	return inv_y
+	def sample(self, y):
+
+		if self.nb_quantiles is None:
+			return self.x_search[np.searchsorted(self.cdf, y, side="left")]
+
+		# Position in the quantiles table
+		position = np.asarray(y) * (self.nb_quantiles-1)
+		index = np.clip(np.floor(position).astype(int), 0, self.nb_quantiles-2)
+		weight = position - index
+
+		return (1.0-weight)*self.quantiles[index] + weight*self.quantiles[index+1]
 
 #---------------------------------
 # MISC FUNCTIONS
@@ -110,43 +151,17 @@ def clean_init_directory(input_data):
 
 	# Create sub-folder
 	os.makedirs(input_data.saving_folder + "/images")
-	os.makedirs(input_data.saving_folder + "/solutions")
-
-	# Initializing incubation times file
-	with open(input_data.saving_folder + "/incubation_times.txt", "a") as f:
-		pass
-
-
 
-def check_disease_times(folder):
 
-	incubation_file =  folder + "/incubation_times.txt"
-	death_file =  folder + "/onset_to_death_times.txt"
-	recovery_file =  folder + "/onset_to_recovery_times.txt"
 
-	try:
-		incubations_times = np.loadtxt(incubation_file)
-		mean_incub = np.mean(incubations_times)
-		std_incub = np.std(incubations_times)
-	except OSError:
-		mean_incub = 0.0
-		std_incub = 0.0
+def check_disease_times(folder, log_format="hdf5"):
 
-	try:
-		death_times = np.loadtxt(death_file)
-		mean_death = np.mean(death_times)
-		std_death = np.std(death_times)
-	except OSError:
-		mean_death = 0.0
-		std_death = 0.0
+	# Disease times written by the event log
+	times = event_log.load_disease_times(folder, log_format)
 
-	try:
-		recovery_times = np.loadtxt(recovery_file)
-		mean_recov = np.mean(recovery_times)
-		std_recov = np.std(recovery_times)
-	except OSError:
-		mean_recov = 0.0
-		std_recov = 0.0
+	mean_incub, std_incub = mean_and_std(times["incubation"])
+	mean_death, std_death = mean_and_std(times["onset_to_death"])
+	mean_recov, std_recov = mean_and_std(times["onset_to_recovery"])
 
 	print(f">> Effective mean incubation time: {mean_incub} days")
 	print(f">> Effective standard deviation of incubation time: {std_incub} days\n")
@@ -159,8 +174,8 @@ def check_disease_times(folder):
 
 
 
-
-
-
-
-
+def mean_and_std(values):
+	# Zero if there is no value
+	if len(values)==0:
+		return 0.0, 0.0
+	return np.mean(values), np.std(values)